@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# Report what each shelf item costs in resident memory.
+#
+#   python3 benchmarks/item_memory.py [--sizes 10000 100000] [--json out.json]
+#
+# Each (layout, size) pair runs in a fresh subprocess that builds the shelf the way the window
+# does (ShelfBatch into a Gio.ListStore plus ShelfIndex), resolves every item to one of a few
+# content types, and reports the RSS growth divided by the item count. "legacy" is the old
+# FileItem layout (eager filename, per-instance defaults, one GIcon per item) for comparison.
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CONTENT_TYPES = ("text/plain", "image/png", "image/jpeg", "application/pdf", "text/csv")
+
+
+def current_rss_kb():
+    # Current (not peak) resident set size
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def child(layout, n):
+    import main
+    from main import Gio, GObject
+
+    paths = [f"/home/user/Downloads/staging/batch_{i // 1000:03d}/file_{i:07d}.txt" for i in range(n)]
+    gc.collect()
+    base = current_rss_kb()
+    if layout == "legacy":
+        class LegacyFileItem(GObject.Object):
+            __gtype_name__ = 'LegacyFileItem'
+
+            def __init__(self, path, pinned=False):
+                super().__init__()
+                self.path = os.path.abspath(path)
+                self.filename = os.path.basename(path)
+                self.search_key = self.filename.lower()
+                self.pinned = pinned
+                self.content_type = None
+                self.resolved = False
+                self.gicon = Gio.ThemedIcon.new("text-x-generic")
+
+        store = Gio.ListStore(item_type=LegacyFileItem)
+        items = [LegacyFileItem(path) for path in paths]
+        by_path = {item.path: item for item in items}
+        store.splice(0, 0, items)
+        for i, item in enumerate(items):
+            item.content_type = CONTENT_TYPES[i % len(CONTENT_TYPES)]
+            item.gicon = Gio.content_type_get_icon(item.content_type)
+            item.resolved = True
+        keep = (store, by_path)
+    else:
+        store = Gio.ListStore(item_type=main.FileItem)
+        index = main.ShelfIndex()
+        batch = main.ShelfBatch(store, index)
+        for path in paths:
+            batch.add(path)
+        batch.commit()
+        for i, item in enumerate(batch.added):
+            item.content_type, item.gicon = main.content_type_icon(CONTENT_TYPES[i % len(CONTENT_TYPES)])
+            item.resolved = True
+        keep = (store, index)
+    del paths
+    gc.collect()
+    grown_kb = current_rss_kb() - base
+    json.dump({"rss_delta_kb": grown_kb, "items": keep[0].get_n_items()}, sys.stdout)
+
+
+def run_child(layout, n):
+    out = subprocess.run([sys.executable, __file__, "--child", layout, str(n)],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--child", nargs=2, metavar=("LAYOUT", "N"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child[0], int(args.child[1]))
+        return
+
+    results = []
+    for n in args.sizes:
+        for layout in ("legacy", "compact"):
+            r = run_child(layout, n)
+            per_item = r["rss_delta_kb"] * 1024 / r["items"]
+            results.append({"layout": layout, "items": r["items"], "rss_delta_mb": r["rss_delta_kb"] / 1024,
+                            "bytes_per_item": per_item})
+            print(f"{n:8} items {layout:8} RSS +{r['rss_delta_kb'] / 1024:7.1f} MB   {per_item:6.0f} bytes/item")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "item_memory", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
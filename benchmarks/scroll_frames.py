@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Measure frame times while scrolling a large shelf in the real window.
+#
+#   python3 benchmarks/scroll_frames.py [--rows 10000] [--images 1000] [--rows-per-frame 5]
+#                                       [--frames 600] [--budget-ms 16.7] [--max-dropped 0.01]
+#                                       [--json out.json]
+#
+# The shelf is filled with synthetic files (a share of them small PNGs, so rows bind real
+# thumbnails), then scrolled down and back up by a fixed number of rows per frame from a
+# tick callback. The down pass decodes thumbnails, the up pass mostly hits the texture cache.
+# Each pass reports the distribution of frame intervals and the texture cache's hits, misses
+# and evictions during that pass. An interval longer than 1.5 frame
+# budgets is a dropped frame; the target is at most 1% dropped frames per pass, and the exit
+# status is 1 when a pass misses it. Needs a display; without one it re-runs under xvfb-run.
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_corpus(directory, rows, images):
+    import gi
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GdkPixbuf
+    os.makedirs(directory)
+    sample = os.path.join(directory, "sample.png")
+    pb = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8, 640, 480)
+    pb.fill(0x3584E4FF)
+    pb.savev(sample, "png", [], [])
+    every = max(rows // images, 1) if images else 0
+    paths = []
+    for i in range(rows):
+        if every and i % every == 0 and i // every < images:
+            path = os.path.join(directory, f"image_{i:06d}.png")
+            # Distinct paths, so each row still needs its own thumbnail
+            os.link(sample, path)
+        else:
+            path = os.path.join(directory, f"notes_{i:06d}.txt")
+            open(path, "w").close()
+        paths.append(path)
+    return paths
+
+
+def summarize(intervals, budget_ms):
+    values = sorted(intervals)
+    p50, p95, p99 = (values[min(len(values) - 1, int(q * len(values)))] for q in (0.5, 0.95, 0.99))
+    return {
+        "frames": len(values),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "max_ms": values[-1],
+        "dropped": sum(v > budget_ms * 1.5 for v in values),
+    }
+
+
+def cache_delta(before, after):
+    # TextureCache counters are cumulative; report what one pass added
+    delta = {key: after[key] - before[key] for key in ("hits", "misses", "evictions")}
+    lookups = delta["hits"] + delta["misses"]
+    delta["hit_rate"] = delta["hits"] / lookups if lookups else 0.0
+    delta["entries"] = after["entries"]
+    delta["bytes"] = after["bytes"]
+    return delta
+
+
+def run(args, tmp):
+    paths = make_corpus(os.path.join(tmp, "files"), args.rows, args.images)
+    os.environ["HOME"] = tmp
+    os.environ["XDG_STATE_HOME"] = os.path.join(tmp, "state")
+    import main
+    from main import Gio, GLib
+
+    results = {}
+
+    class ScrollBench(main.DropShelfApp):
+        def on_restored(self, win):
+            super().on_restored(win)
+            win.add_paths(paths)
+            GLib.timeout_add(1000, self.start_pass, win, "down")
+
+        def start_pass(self, win, direction):
+            self.intervals = []
+            self.last_frame = None
+            self.frames = 0
+            self.cache_before = win.texture_cache.stats()
+            win.list_view.add_tick_callback(self.on_tick, (win, direction))
+            return False
+
+        def on_tick(self, widget, clock, data):
+            win, direction = data
+            now = clock.get_frame_time()
+            if self.last_frame is not None:
+                self.intervals.append((now - self.last_frame) / 1000)
+            self.last_frame = now
+            adj = win.scrolled_window.get_vadjustment()
+            row_height = adj.get_upper() / max(win.store.get_n_items(), 1)
+            step = args.rows_per_frame * row_height * (1 if direction == "down" else -1)
+            adj.set_value(min(max(adj.get_value() + step, 0), adj.get_upper() - adj.get_page_size()))
+            self.frames += 1
+            at_end = adj.get_value() <= 0 if direction == "up" else adj.get_value() >= adj.get_upper() - adj.get_page_size()
+            if self.frames < args.frames and not at_end:
+                return GLib.SOURCE_CONTINUE
+            results[direction] = summarize(self.intervals, args.budget_ms)
+            results[direction]["texture_cache"] = cache_delta(self.cache_before, win.texture_cache.stats())
+            if direction == "down":
+                GLib.timeout_add(500, self.start_pass, win, "up")
+            else:
+                self.quit()
+            return GLib.SOURCE_REMOVE
+
+    app = ScrollBench()
+    app.set_flags(app.get_flags() | Gio.ApplicationFlags.NON_UNIQUE)
+    app.run([sys.argv[0]])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--images", type=int, default=1000, help="how many rows are thumbnailed PNGs")
+    parser.add_argument("--rows-per-frame", type=float, default=5)
+    parser.add_argument("--frames", type=int, default=600, help="frames per pass at most")
+    parser.add_argument("--budget-ms", type=float, default=1000 / 60, help="frame budget (60 Hz by default)")
+    parser.add_argument("--max-dropped", type=float, default=0.01, help="allowed share of dropped frames")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        if not shutil.which("xvfb-run"):
+            sys.exit("no display available and xvfb-run is not installed")
+        sys.exit(subprocess.run(["xvfb-run", "-a", sys.executable] + sys.argv).returncode)
+
+    with tempfile.TemporaryDirectory(prefix="dropshelf-scroll-") as tmp:
+        results = run(args, tmp)
+    failed = False
+    for direction, r in results.items():
+        failed |= r["dropped"] > args.max_dropped * r["frames"]
+        print(f"{direction:4} {r['frames']:5} frames  p50 {r['p50_ms']:6.1f}  p95 {r['p95_ms']:6.1f}"
+              f"  p99 {r['p99_ms']:6.1f}  max {r['max_ms']:6.1f} ms   {r['dropped']} dropped")
+        cache = r["texture_cache"]
+        print(f"     texture cache  {cache['hits']} hits  {cache['misses']} misses  {cache['evictions']} evictions"
+              f"  ({cache['hit_rate']:.0%} hit rate)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "scroll_frames", "rows": args.rows, "images": args.images,
+                       "rows_per_frame": args.rows_per_frame, "budget_ms": args.budget_ms, "results": results},
+                      f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
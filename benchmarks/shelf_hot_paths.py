@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# Time the shelf's hot paths on synthetic corpora, without a display.
+#
+#   python3 benchmarks/shelf_hot_paths.py [--sizes 1000 10000 100000] [--runs 5]
+#                                         [--only drop filter ...] [--json out.json]
+#                                         [--compare baseline.json]
+#
+# Everything here drives the same objects the window does (ShelfIndex/ShelfBatch on a
+# Gio.ListStore behind a Gtk.FilterListModel, the storage backends, the thumbnail caches)
+# but never creates a widget, so no display server is needed:
+#   drop        N files dropped at once, as on_file_drop -> add_file_path_to_store
+#   bind        per-row thumbnail cost behind on_factory_bind: render, disk hit, texture hit
+#   filter      typing "report_2" one key at a time with the strictness hints apply_search uses
+#   save/load   state written and read back through the JSON and SQLite backends
+#   drag_remove removing every unpinned row in one batch, as on_drag_end does
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import main as dropshelf  # noqa: E402
+from main import Gtk, Gio, Gdk, GLib, GdkPixbuf  # noqa: E402
+
+WORDS = ("report", "invoice", "photo", "scan", "notes", "draft", "final", "budget", "slides", "export")
+EXTENSIONS = (".txt", ".png", ".jpg", ".pdf", ".md", ".csv")
+SCENARIOS = ("drop", "bind", "filter", "save", "load", "drag_remove")
+BIND_IMAGES = [("photo_4000x3000.jpg", "jpeg", 4000, 3000), ("screenshot_1920x1080.png", "png", 1920, 1080)]
+
+
+def synthetic_paths(directory, count, seed=0):
+    rng = random.Random(seed)
+    return [os.path.join(directory, f"{rng.choice(WORDS)}_{i}{rng.choice(EXTENSIONS)}") for i in range(count)]
+
+
+def make_files(directory, count):
+    # Real (empty) files, so existence checks and stats cost what they do on a shelf
+    os.makedirs(directory, exist_ok=True)
+    paths = synthetic_paths(directory, count)
+    for path in paths:
+        if not os.path.exists(path):
+            open(path, "w").close()
+    return paths
+
+
+def make_image(path, fmt, w, h):
+    pattern = bytes(i & 0xFF for i in range(w * 3 + h))
+    data = b"".join(pattern[y:y + w * 3] for y in range(h))
+    pb = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(data), GdkPixbuf.Colorspace.RGB, False, 8, w, h, w * 3)
+    pb.savev(path, fmt, [], [])
+
+
+class Shelf:
+    # The window's model stack minus the widgets
+    def __init__(self):
+        self.store = Gio.ListStore(item_type=dropshelf.FileItem)
+        self.index = dropshelf.ShelfIndex()
+        self.search = SimpleNamespace(search_query="", content_matches=None)
+        self.filter = Gtk.CustomFilter.new(match_func=lambda item, *_: dropshelf.DropShelfWindow.filter_func(self.search, item))
+        self.filter_model = Gtk.FilterListModel(model=self.store, filter=self.filter)
+
+    def add(self, paths, pinned=lambda i: False):
+        batch = dropshelf.ShelfBatch(self.store, self.index)
+        for i, path in enumerate(paths):
+            if os.path.exists(path):
+                batch.add(path, pinned(i))
+        batch.commit()
+        return batch
+
+    def snapshot(self):
+        items = []
+        for i in range(self.store.get_n_items()):
+            item = self.store.get_item(i)
+            items.append((item.path, item.filename, item.pinned))
+        return items, {}
+
+
+def measure(fn, setup, runs):
+    times = []
+    for _ in range(runs):
+        state = setup()
+        start = time.perf_counter()
+        fn(state)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {"median_ms": times[len(times) // 2] * 1000, "min_ms": times[0] * 1000, "runs": runs}
+
+
+def bench_drop(tmp, n, runs):
+    paths = make_files(os.path.join(tmp, "files"), n)
+    return measure(lambda shelf: shelf.add(paths), Shelf, runs)
+
+
+def bench_filter(tmp, n, runs):
+    paths = make_files(os.path.join(tmp, "files"), n)
+
+    def setup():
+        shelf = Shelf()
+        shelf.add(paths)
+        shelf.filter_model.get_n_items()
+        return shelf
+
+    def type_query(shelf):
+        old = ""
+        for i in range(1, len("report_2") + 1):
+            query = "report_2"[:i]
+            shelf.search.search_query = query
+            shelf.filter.changed(Gtk.FilterChange.MORE_STRICT if old in query else Gtk.FilterChange.DIFFERENT)
+            shelf.filter_model.get_n_items()
+            old = query
+        # ...and backspace it all away
+        for i in range(len(old) - 1, -1, -1):
+            shelf.search.search_query = old[:i]
+            shelf.filter.changed(Gtk.FilterChange.LESS_STRICT)
+            shelf.filter_model.get_n_items()
+
+    return measure(type_query, setup, runs)
+
+
+def bench_drag_remove(tmp, n, runs):
+    paths = make_files(os.path.join(tmp, "files"), n)
+
+    def setup():
+        shelf = Shelf()
+        shelf.add(paths, pinned=lambda i: i % 10 == 0)
+        return shelf
+
+    def remove_unpinned(shelf):
+        batch = dropshelf.ShelfBatch(shelf.store, shelf.index)
+        for i in range(shelf.filter_model.get_n_items()):
+            item = shelf.filter_model.get_item(i)
+            if not item.pinned:
+                batch.remove(item)
+        batch.commit()
+
+    return measure(remove_unpinned, setup, runs)
+
+
+def open_backend(backend, state_dir, shelf):
+    if backend == "sqlite":
+        return dropshelf.SqliteShelfStorage(os.path.join(state_dir, "shelf.db"))
+    return dropshelf.JsonShelfStorage(os.path.join(state_dir, "state.json"), os.path.join(state_dir, "legacy.json"),
+                                       shelf.snapshot)
+
+
+def bench_save(tmp, n, runs, backend):
+    paths = make_files(os.path.join(tmp, "files"), n)
+    counter = iter(range(runs))
+
+    def setup():
+        shelf = Shelf()
+        batch = shelf.add(paths)
+        storage = open_backend(backend, os.path.join(tmp, f"save-{backend}-{next(counter)}"), shelf)
+        return storage, batch
+
+    def save(state):
+        storage, batch = state
+        storage.items_changed(batch.added, [])
+        storage.flush()
+
+    return measure(save, setup, runs)
+
+
+def bench_load(tmp, n, runs, backend):
+    paths = make_files(os.path.join(tmp, "files"), n)
+    state_dir = os.path.join(tmp, f"load-{backend}")
+    source = Shelf()
+    batch = source.add(paths)
+    storage = open_backend(backend, state_dir, source)
+    storage.items_changed(batch.added, [])
+    storage.flush()
+
+    def setup():
+        shelf = Shelf()
+        return shelf, open_backend(backend, state_dir, shelf)
+
+    def load(state):
+        # load_state + every restore_next_page, back to back
+        shelf, storage = state
+        settings, pages = storage.load()
+        for page in pages:
+            b = dropshelf.ShelfBatch(shelf.store, shelf.index)
+            for path, pinned in page:
+                b.add(path, pinned)
+            b.commit()
+
+    return measure(load, setup, runs)
+
+
+def bench_bind(tmp, runs):
+    # One row's thumbnail, from most to least expensive source
+    results = []
+    size = 56
+    for name, fmt, w, h in BIND_IMAGES:
+        path = os.path.join(tmp, name)
+        make_image(path, fmt, w, h)
+        st = os.stat(path)
+        disk = dropshelf.ThumbnailDiskCache(os.path.join(tmp, "thumbnails"))
+
+        def render(_):
+            dropshelf.render_thumbnail(path, size)
+        results.append((f"{name} render", measure(render, lambda: None, runs)))
+
+        disk.store(path, st, size, dropshelf.render_thumbnail(path, size))
+
+        def disk_hit(_):
+            Gdk.Texture.new_for_pixbuf(disk.lookup(path, st, size))
+        results.append((f"{name} disk hit", measure(disk_hit, lambda: None, runs)))
+
+        textures = dropshelf.TextureCache(32 * 1024 * 1024)
+        textures.put(path, Gdk.Texture.new_for_pixbuf(disk.lookup(path, st, size)), dropshelf.file_stamp(path))
+        results.append((f"{name} texture hit", measure(lambda _: textures.get(path), lambda: None, runs)))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["n"], r.get("variant")): r for r in json.load(f)["results"]}
+    print(f"\nagainst {baseline_path}:")
+    for r in results:
+        old = baseline.get((r["scenario"], r["n"], r.get("variant")))
+        if old:
+            change = (r["median_ms"] - old["median_ms"]) / old["median_ms"] * 100 if old["median_ms"] else 0.0
+            print(f"{r['scenario']:12} {r.get('variant') or '':32} n={r['n']:<7} {old['median_ms']:9.2f} -> "
+                  f"{r['median_ms']:9.2f} ms  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="print changes against an earlier --json file")
+    args = parser.parse_args()
+
+    results = []
+
+    def record(scenario, n, data, variant=None):
+        results.append({"scenario": scenario, "n": n, "variant": variant, **data})
+        print(f"{scenario:12} {variant or '':32} n={n:<7} median {data['median_ms']:9.2f} ms   min {data['min_ms']:9.2f} ms")
+
+    with tempfile.TemporaryDirectory(prefix="dropshelf-bench-") as tmp:
+        if "bind" in args.only:
+            for variant, data in bench_bind(tmp, args.runs):
+                record("bind", 1, data, variant)
+        for n in args.sizes:
+            if "drop" in args.only:
+                record("drop", n, bench_drop(tmp, n, args.runs))
+            if "filter" in args.only:
+                record("filter", n, bench_filter(tmp, n, args.runs))
+            for backend in ("json", "sqlite"):
+                if "save" in args.only:
+                    record("save", n, bench_save(tmp, n, args.runs, backend), backend)
+                if "load" in args.only:
+                    record("load", n, bench_load(tmp, n, args.runs, backend), backend)
+            if "drag_remove" in args.only:
+                record("drag_remove", n, bench_drag_remove(tmp, n, args.runs))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "shelf_hot_paths", "revision": git_revision(), "python": sys.version.split()[0],
+                       "gtk": f"{Gtk.get_major_version()}.{Gtk.get_minor_version()}.{Gtk.get_micro_version()}",
+                       "results": results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
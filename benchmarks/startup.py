@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# Measure DropShelf startup, cold and warm, for shelves of several sizes.
+#
+#   python3 benchmarks/startup.py [--items 0 1000 10000] [--runs 5] [--json out.json]
+#
+# Every launch runs `main.py --startup-profile` against a throwaway HOME/XDG_STATE_HOME holding
+# a state.json with the requested number of (real, empty) files. The first launch of each size
+# is "cold": it gets a fresh bytecode cache and, when running as root, a dropped page cache.
+# The remaining launches are "warm". Needs a display; without one the run is wrapped in xvfb-run.
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+
+
+def make_shelf(home, count):
+    files_dir = os.path.join(home, "files")
+    os.makedirs(files_dir)
+    items = []
+    for i in range(count):
+        path = os.path.join(files_dir, f"file_{i:06d}.txt")
+        open(path, "w").close()
+        items.append({"path": path, "filename": os.path.basename(path), "pinned": False})
+    state_dir = os.path.join(home, ".local", "state", "dropshelf")
+    os.makedirs(state_dir)
+    with open(os.path.join(state_dir, "state.json"), "w") as f:
+        json.dump({"items": items, "settings": None}, f)
+
+
+def drop_page_cache():
+    try:
+        subprocess.run(["sync"], check=False)
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def launch(home, pycache):
+    env = dict(os.environ, HOME=home, XDG_STATE_HOME=os.path.join(home, ".local", "state"),
+               PYTHONPYCACHEPREFIX=pycache)
+    env.pop("DROPSHELF_STORAGE", None)
+    cmd = [sys.executable, MAIN, "--startup-profile"]
+    if not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        if not shutil.which("xvfb-run"):
+            sys.exit("no display available and xvfb-run is not installed")
+        cmd = ["xvfb-run", "-a"] + cmd
+    start = time.perf_counter()
+    out = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True, timeout=300).stdout
+    wall = (time.perf_counter() - start) * 1000
+    report = json.loads(out.strip().splitlines()[-1])
+    report["wall_ms"] = wall
+    return report
+
+
+def summarize(runs):
+    marks = {}
+    for name in runs[0]["marks_ms"]:
+        values = sorted(r["marks_ms"][name] for r in runs)
+        marks[name] = values[len(values) // 2]
+    walls = sorted(r["wall_ms"] for r in runs)
+    return {"marks_ms": marks, "wall_ms": walls[len(walls) // 2]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, nargs="+", default=[0, 1000, 10000])
+    parser.add_argument("--runs", type=int, default=5, help="warm launches per size")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    for count in args.items:
+        with tempfile.TemporaryDirectory(prefix="dropshelf-startup-") as home:
+            make_shelf(home, count)
+            pycache = os.path.join(home, "pycache")
+            dropped = drop_page_cache()
+            cold = launch(home, pycache)
+            warm = summarize([launch(home, pycache) for _ in range(args.runs)])
+        for kind, data in (("cold", {"marks_ms": cold["marks_ms"], "wall_ms": cold["wall_ms"]}), ("warm", warm)):
+            results.append({"items": count, "kind": kind, **data})
+            marks = data["marks_ms"]
+            print(f"{count:7} items {kind:4}  first frame {marks.get('first_frame', 0):7.1f} ms"
+                  f"   restored {marks.get('restored', 0):8.1f} ms   wall {data['wall_ms']:8.1f} ms")
+        if not dropped:
+            print("        (page cache not dropped: cold run only has a fresh bytecode cache)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "startup", "runs": args.runs, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# Compare the old full-resolution thumbnail path against the size-aware loader in main.py.
+#
+#   python3 benchmarks/thumbnail_decode.py [--runs 5] [--json out.json]
+#
+# Each (method, image) pair runs in a fresh subprocess so ru_maxrss reflects that decode only.
+# PNG/WebP have no scaled decode, so the loader skips images above main.MAX_FULL_DECODE_PIXELS
+# (the row keeps its icon); those runs are reported as "skipped".
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TARGET_SIZE = 56
+CORPUS = [
+    ("photo_6000x4000.jpg", "jpeg", 6000, 4000),
+    ("scan_8000x6000.png", "png", 8000, 6000),
+    ("screenshot_1920x1080.png", "png", 1920, 1080),
+]
+
+
+def legacy_render(path, target_size):
+    # The pre-loader implementation: decode everything, scale, then crop
+    from gi.repository import GdkPixbuf
+    pb = GdkPixbuf.Pixbuf.new_from_file(path)
+    w, h = pb.get_width(), pb.get_height()
+    scale = max(target_size / w, target_size / h)
+    new_w = max(int(w * scale), target_size)
+    new_h = max(int(h * scale), target_size)
+    pb_scaled = pb.scale_simple(new_w, new_h, GdkPixbuf.InterpType.BILINEAR)
+    x_off = max((pb_scaled.get_width() - target_size) // 2, 0)
+    y_off = max((pb_scaled.get_height() - target_size) // 2, 0)
+    return pb_scaled.new_subpixbuf(x_off, y_off, target_size, target_size)
+
+
+def make_image(path, fmt, w, h):
+    import gi
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GdkPixbuf, GLib
+    # Diagonal gradient: cheap to build, not trivially compressible
+    pattern = bytes(i & 0xFF for i in range(w * 3 + h))
+    data = b"".join(pattern[y:y + w * 3] for y in range(h))
+    pb = GdkPixbuf.Pixbuf.new_from_bytes(GLib.Bytes.new(data), GdkPixbuf.Colorspace.RGB, False, 8, w, h, w * 3)
+    pb.savev(path, fmt, [], [])
+
+
+def child(method, path):
+    import gi
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GdkPixbuf  # noqa: F401  (import cost excluded from the measurement)
+    if method == "legacy":
+        render = legacy_render
+    else:
+        from main import render_thumbnail as render
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    pb = render(path, TARGET_SIZE)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    json.dump({
+        "seconds": elapsed,
+        "peak_rss_delta_kb": peak_rss - base_rss,
+        "size": [pb.get_width(), pb.get_height()] if pb is not None else None,
+    }, sys.stdout)
+
+
+def run_child(method, path):
+    out = subprocess.run([sys.executable, __file__, "--child", method, path],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--child", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="dropshelf-bench-") as tmp:
+        for name, fmt, w, h in CORPUS:
+            path = os.path.join(tmp, name)
+            make_image(path, fmt, w, h)
+            for method in ("legacy", "loader"):
+                runs = [run_child(method, path) for _ in range(args.runs)]
+                secs = sorted(r["seconds"] for r in runs)
+                rss = max(r["peak_rss_delta_kb"] for r in runs)
+                results.append({
+                    "image": name,
+                    "method": method,
+                    "median_ms": secs[len(secs) // 2] * 1000,
+                    "min_ms": secs[0] * 1000,
+                    "peak_rss_delta_mb": rss / 1024,
+                    "skipped": runs[0]["size"] is None,
+                })
+                print(f"{name:28} {method:7} median {results[-1]['median_ms']:8.1f} ms"
+                      f"   peak RSS +{results[-1]['peak_rss_delta_mb']:7.1f} MB"
+                      + ("   (skipped: over the full-decode pixel cap)" if results[-1]["skipped"] else ""))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "thumbnail_decode", "target_size": TARGET_SIZE, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
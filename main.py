@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
+import time
+STARTUP_T0 = time.perf_counter()
 import sys
 import os
-import shutil
 import json
 import warnings
-import urllib.request
-import base64
 import threading
-from urllib.parse import urlparse, unquote
+import queue
+import concurrent.futures
+import functools
+# Only what the first frame needs is imported here. Modules for downloads (http.client,
+# ssl), CSV collection, the SQLite backend, content search and data URIs are imported
+# by the functions that use them, so startup does not pay for features left idle.
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+import hashlib
+from urllib.parse import urlparse, urlsplit, urljoin, unquote, unquote_to_bytes
 
 
 import gi
@@ -20,6 +28,7 @@ gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 gi.require_version('GdkPixbuf', '2.0')
 from gi.repository import Gtk, Adw, Gio, Gdk, GObject, GLib, GdkPixbuf
+STARTUP_IMPORTED = time.perf_counter()
 
 
 warnings.filterwarnings("ignore")
@@ -27,26 +36,2020 @@ warnings.filterwarnings("ignore")
 
 warnings.filterwarnings("ignore")
 
+# --- TRACING ---
+STALL_HEARTBEAT_MS = 20
+STALL_THRESHOLD_MS = 8
+
+
+def trace_path(argv, environ):
+    # Looked at once, at import, so disabled tracing leaves every traced function untouched
+    for i, arg in enumerate(argv):
+        if arg == "--trace" and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith("--trace="):
+            return arg.split("=", 1)[1]
+    return environ.get("DROPSHELF_TRACE") or None
+
+
+class Tracer:
+    # Collects complete ("X") events in the Chrome trace format, which Perfetto and
+    # chrome://tracing open directly. Appending to a list is safe from any thread.
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.events = []
+        self.thread_names = {}
+        self.heartbeat_due = None
+
+    def record(self, name, start, end):
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.events.append((name, start, end - start, tid))
+
+    def start_heartbeat(self):
+        # A timeout that fires late means the main loop was busy for that long
+        self.heartbeat_due = time.perf_counter() + STALL_HEARTBEAT_MS / 1000
+        GLib.timeout_add(STALL_HEARTBEAT_MS, self._heartbeat)
+
+    def _heartbeat(self):
+        now = time.perf_counter()
+        if (now - self.heartbeat_due) * 1000 > STALL_THRESHOLD_MS:
+            self.record("main_loop.stall", self.heartbeat_due, now)
+        self.heartbeat_due = now + STALL_HEARTBEAT_MS / 1000
+        return True
+
+    def write(self):
+        events = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in self.thread_names.items()]
+        events.extend({"name": name, "ph": "X", "pid": self.pid, "tid": tid, "ts": start * 1e6, "dur": dur * 1e6}
+                      for name, start, dur, tid in self.events)
+        try:
+            with open(self.path, "w") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        except OSError as e:
+            print(f"[TRACE] Failed to write {self.path}: {e}", file=sys.stderr)
+        self.print_summary()
+
+    def print_summary(self):
+        durations = {}
+        for name, _, dur, _ in self.events:
+            durations.setdefault(name, []).append(dur * 1000)
+        print(f"[TRACE] {len(self.events)} spans written to {self.path}", file=sys.stderr)
+        print(f"[TRACE] {'span':<24} {'count':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  (ms)", file=sys.stderr)
+        for name, values in sorted(durations.items()):
+            values.sort()
+            p50, p90, p99 = (values[min(len(values) - 1, int(q * len(values)))] for q in (0.5, 0.9, 0.99))
+            print(f"[TRACE] {name:<24} {len(values):>7} {p50:>9.2f} {p90:>9.2f} {p99:>9.2f} {values[-1]:>9.2f}",
+                  file=sys.stderr)
+
+
+TRACE_PATH = trace_path(sys.argv, os.environ)
+TRACER = Tracer(TRACE_PATH) if TRACE_PATH else None
+
+
+def traced(name):
+    # Decorator for hot paths; returns the function itself when tracing is off
+    def decorate(func):
+        if TRACER is None:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                TRACER.record(name, start, time.perf_counter())
+        return wrapper
+    return decorate
+
+
 # --- DATA MODEL ---
+GENERIC_ICON = Gio.ThemedIcon.new("text-x-generic")
+CONTENT_TYPE_ICONS = {}  # content type -> (interned type string, shared GIcon)
+
+
+def content_type_icon(content_type):
+    # Items of the same type share one type string and one GIcon
+    entry = CONTENT_TYPE_ICONS.get(content_type)
+    if entry is None:
+        entry = CONTENT_TYPE_ICONS[content_type] = (sys.intern(content_type), Gio.content_type_get_icon(content_type))
+    return entry
+
+
 class FileItem(GObject.Object):
     __gtype_name__ = 'FileItem'
+    # Defaults live on the class so a fresh item's instance dict only holds path and
+    # search_key; MetadataResolver fills in content_type and gicon, rows show GENERIC_ICON until then
+    pinned = False
+    content_type = None
+    resolved = False
+    gicon = GENERIC_ICON
     
     def __init__(self, path, pinned=False):
         super().__init__()
-        self.path = os.path.abspath(path)
-        self.filename = os.path.basename(path)
-        self.pinned = pinned
-        
+        self.path = os.path.abspath(path)
+        # Precomputed once so filtering never lowercases per keystroke
+        self.search_key = os.path.basename(self.path).lower()
+        if pinned:
+            self.pinned = True
+
+    @property
+    def filename(self):
+        return os.path.basename(self.path)
+
+    def rename(self, path):
+        self.path = os.path.abspath(path)
+        self.search_key = os.path.basename(self.path).lower()
+        self.resolved = False
+
+
+class MetadataResolver:
+    # Resolves FileItem content types with query_info_async, a bounded number at a time,
+    # and hands results back in batches so the window updates once per burst.
+    # Items whose file no longer exists are reported as missing instead.
+    def __init__(self, on_resolved, max_in_flight=16, batch_delay_ms=50):
+        self.on_resolved = on_resolved
+        self.max_in_flight = max_in_flight
+        self.batch_delay_ms = batch_delay_ms
+        self.queue = deque()
+        self.in_flight = set()
+        self.resolved = []
+        self.missing = []
+        self.flush_id = 0
+        self.cancellable = Gio.Cancellable()
+
+    def enqueue(self, items):
+        self.queue.extend(items)
+        self._pump()
+
+    def prioritize(self, item):
+        # Rows on screen jump the queue
+        if not item.resolved and item not in self.in_flight:
+            self.queue.appendleft(item)
+            self._pump()
+
+    def _pump(self):
+        while self.queue and len(self.in_flight) < self.max_in_flight:
+            item = self.queue.popleft()
+            if item.resolved or item in self.in_flight:
+                continue
+            self.in_flight.add(item)
+            gfile = Gio.File.new_for_path(item.path)
+            gfile.query_info_async(Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE, Gio.FileQueryInfoFlags.NONE,
+                                   GLib.PRIORITY_LOW, self.cancellable, self._on_info, item)
+
+    def _on_info(self, gfile, result, item):
+        self.in_flight.discard(item)
+        try:
+            info = gfile.query_info_finish(result)
+            item.content_type, item.gicon = content_type_icon(info.get_content_type())
+            item.resolved = True
+            self.resolved.append(item)
+        except GLib.Error as e:
+            if e.matches(Gio.io_error_quark(), Gio.IOErrorEnum.CANCELLED):
+                return
+            item.resolved = True
+            if e.matches(Gio.io_error_quark(), Gio.IOErrorEnum.NOT_FOUND):
+                self.missing.append(item)
+        if not self.flush_id:
+            self.flush_id = GLib.timeout_add(self.batch_delay_ms, self._flush)
+        self._pump()
+
+    def _flush(self):
+        self.flush_id = 0
+        resolved, missing = self.resolved, self.missing
+        self.resolved, self.missing = [], []
+        self.on_resolved(resolved, missing)
+        return False
+
+    def cancel(self):
+        self.cancellable.cancel()
+        self.queue.clear()
+        if self.flush_id:
+            GLib.source_remove(self.flush_id)
+            self.flush_id = 0
+
+
+# --- SHELF INDEX ---
+class ShelfIndex:
+    # Kept alongside the Gio.ListStore: path -> item for dedupe, and item -> position via a
+    # Fenwick tree over append order. Every store mutation must go through here as well.
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.by_path = {}
+        self.slots = {}  # item -> slot in append order
+        self.tree = [0] * 65  # 1-based Fenwick tree, 1 per live slot
+        self.next_slot = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, path):
+        return path in self.by_path
+
+    def get(self, path):
+        return self.by_path.get(path)
+
+    def append(self, item):
+        if self.next_slot + 1 >= len(self.tree):
+            self._grow()
+        slot = self.next_slot
+        self.next_slot += 1
+        self.slots[item] = slot
+        self.by_path[item.path] = item
+        self._add(slot, 1)
+
+    def remove(self, item):
+        slot = self.slots.pop(item, None)
+        if slot is None:
+            return
+        if self.by_path.get(item.path) is item:
+            del self.by_path[item.path]
+        self._add(slot, -1)
+
+    def rename(self, item, path):
+        if self.by_path.get(item.path) is item:
+            del self.by_path[item.path]
+        item.rename(path)
+        self.by_path[item.path] = item
+
+    def position(self, item):
+        slot = self.slots.get(item)
+        if slot is None:
+            return None
+        # Live slots before this one == index in the store
+        i, pos = slot, 0
+        while i > 0:
+            pos += self.tree[i]
+            i -= i & -i
+        return pos
+
+    def rebuild(self, store):
+        self.clear()
+        for i in range(store.get_n_items()):
+            self.append(store.get_item(i))
+
+    def _add(self, slot, delta):
+        i = slot + 1
+        n = len(self.tree)
+        while i < n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def _grow(self):
+        # Compact slots (drops holes left by removals) and double capacity when mostly full
+        live = sorted(self.slots.items(), key=lambda kv: kv[1])
+        size = len(self.tree) - 1
+        if len(live) * 2 > size:
+            size *= 2
+        tree = [0] * (size + 1)
+        for slot, (item, _) in enumerate(live):
+            self.slots[item] = slot
+            tree[slot + 1] = 1
+        for i in range(1, size + 1):
+            j = i + (i & -i)
+            if j <= size:
+                tree[j] += tree[i]
+        self.tree = tree
+        self.next_slot = len(live)
+
+
+class ShelfBatch:
+    # Collects adds and removes, then applies them with one Gio.ListStore.splice so the
+    # views see a single items-changed no matter how many files were touched.
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        self.added = []
+        self.added_paths = set()
+        self.removed = {}  # item -> None, keeps insertion order
+
+    def add(self, path, pinned=False):
+        path = os.path.abspath(path)
+        if path in self.index or path in self.added_paths:
+            return None
+        item = FileItem(path, pinned)
+        self.added.append(item)
+        self.added_paths.add(path)
+        return item
+
+    def remove(self, item):
+        if item in self.index.slots:
+            self.removed[item] = None
+        elif item.path in self.added_paths:
+            self.added.remove(item)
+            self.added_paths.discard(item.path)
+
+    def __bool__(self):
+        return bool(self.added or self.removed)
+
+    def commit(self):
+        if not self:
+            return False
+        if not self.added:
+            # Removals only: rewrite just the span between the first and last removed rows
+            positions = [self.index.position(item) for item in self.removed]
+            first, last = min(positions), max(positions)
+            survivors = []
+            for i in range(first, last + 1):
+                item = self.store.get_item(i)
+                if item not in self.removed:
+                    survivors.append(item)
+            for item in self.removed:
+                self.index.remove(item)
+            self.store.splice(first, last - first + 1, survivors)
+            return True
+        n = self.store.get_n_items()
+        first = min((self.index.position(item) for item in self.removed), default=n)
+        # Everything from the first removed row onwards is replaced in one splice
+        tail = []
+        for i in range(first, n):
+            item = self.store.get_item(i)
+            if item not in self.removed:
+                tail.append(item)
+        tail.extend(self.added)
+        for item in self.removed:
+            self.index.remove(item)
+        for item in self.added:
+            self.index.append(item)
+        self.store.splice(first, n - first, tail)
+        return True
+
+
+SEARCH_DEBOUNCE_MS = 120
+INCREMENTAL_FILTER_THRESHOLD = 5000
+
+
+# --- CACHE STORE ---
+class BlobStore:
+    # Content-addressed storage for what DropShelf writes into its cache folder. Bytes live
+    # once under .blobs/<sha256>; the names users see are hardlinks to them, so dropping the
+    # same content twice reuses the existing file. Naming takes at most three probes.
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, ".blobs")
+        self.lock = threading.Lock()
+        self.names = {}  # digest -> user-facing path
+        self.stamps = {}  # digest -> (st_size, st_mtime_ns) of the blob as committed
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def write(self, filename, chunks):
+        # Stores an iterable of byte chunks, hashing as it writes; returns the user-facing path
+        import tempfile
+        os.makedirs(self.blob_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.blob_dir, suffix=".tmp")
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return self._commit(tmp, digest.hexdigest(), filename)
+
+    def ingest_file(self, path, filename):
+        # Takes ownership of a finished file (e.g. a download) that lives in the cache folder
+        return self._commit(path, self._hash_file(path), filename)
+
+    @staticmethod
+    def _hash_file(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _intact(self, blob, digest):
+        # Names are hardlinks, so editing one in place edits the blob too. A blob whose size or
+        # mtime moved since it was committed (or that predates this session) is re-hashed.
+        st = os.stat(blob)
+        stamp = (st.st_size, st.st_mtime_ns)
+        if self.stamps.get(digest) == stamp:
+            return True
+        if self._hash_file(blob) == digest:
+            self.stamps[digest] = stamp
+            return True
+        return False
+
+    def _commit(self, tmp, digest, filename):
+        blob = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        with self.lock:
+            try:
+                intact = self._intact(blob, digest)
+            except FileNotFoundError:
+                intact = False
+            if intact:
+                os.remove(tmp)
+            else:
+                # The edited inode stays with the names that edited it; the blob gets fresh bytes
+                os.replace(tmp, blob)
+                st = os.stat(blob)
+                self.stamps[digest] = (st.st_size, st.st_mtime_ns)
+            known = self.names.get(digest)
+            if known and self._same(known, blob):
+                return known
+            path = self._link(blob, digest, filename or digest)
+            self.names[digest] = path
+            return path
+
+    @staticmethod
+    def _safe_name(filename, digest):
+        # Names come from URLs and drops: never let one leave the cache folder
+        name = os.path.basename(filename or "")
+        if name in ("", ".", "..") or "\0" in name:
+            return digest
+        return name
+
+    def _link(self, blob, digest, filename):
+        filename = self._safe_name(filename, digest)
+        base, ext = os.path.splitext(filename)
+        for candidate in (filename, f"{base}_{digest[:8]}{ext}", digest + ext):
+            path = os.path.join(self.cache_dir, candidate)
+            if self._same(path, blob):
+                return path
+            try:
+                os.link(blob, path)
+                return path
+            except FileExistsError:
+                continue
+            except OSError:
+                pass
+            # Filesystem without hardlinks: fall back to a private copy
+            try:
+                import shutil
+                with open(blob, "rb") as src, open(path, "xb") as dst:
+                    shutil.copyfileobj(src, dst)
+                return path
+            except FileExistsError:
+                continue
+        raise OSError(f"no free name for {filename}")
+
+    def _same(self, path, blob):
+        try:
+            return os.path.samefile(path, blob)
+        except OSError:
+            return False
+
+    def collect_garbage(self):
+        # Blobs whose only link left is the blob itself are no longer referenced by any name
+        with self.lock:
+            for root, dirs, files in os.walk(self.blob_dir):
+                for name in files:
+                    if name.endswith(".tmp"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        if os.lstat(path).st_nlink <= 1:
+                            os.remove(path)
+                            self.names.pop(name, None)
+                            self.stamps.pop(name, None)
+                    except OSError:
+                        pass
+
+    def reset(self):
+        with self.lock:
+            self.names.clear()
+            self.stamps.clear()
+
+
+# --- DATA URIS ---
+DATA_URI_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "image/svg+xml": ".svg",
+    "image/bmp": ".bmp",
+    "image/avif": ".avif",
+    "image/x-icon": ".ico",
+}
+
+def parse_data_uri(uri):
+    # Returns (mime type, is_base64, offset of the payload) without copying the payload
+    comma = uri.find(",")
+    if not uri.startswith("data:") or comma < 0:
+        raise ValueError("not a data: URI")
+    params = uri[5:comma].split(";")
+    mime = params[0].strip().lower() or "text/plain"
+    is_base64 = any(p.strip().lower() == "base64" for p in params[1:])
+    return mime, is_base64, comma + 1
+
+def data_uri_extension(mime):
+    import mimetypes
+    return DATA_URI_EXTENSIONS.get(mime) or mimetypes.guess_extension(mime) or ".png"
+
+def iter_data_uri_payload(uri, start, is_base64, chunk_chars=256 * 1024):
+    # Decodes the payload slice by slice so only one chunk is ever held decoded
+    if not is_base64:
+        pos = start
+        while pos < len(uri):
+            # Never split a %XX escape across chunks
+            end = pos + chunk_chars
+            while end < len(uri) and "%" in uri[end - 2:end]:
+                end -= 1
+            yield unquote_to_bytes(uri[pos:end])
+            pos = end
+        return
+    import base64
+    import re
+    # b64decode drops characters outside the alphabet (spaces, newlines); drop them before
+    # aligning to 4 characters too, or one stray space shifts every chunk after it
+    junk = re.compile(r"[^A-Za-z0-9+/=]+")
+    pending = ""
+    for pos in range(start, len(uri), chunk_chars):
+        piece = pending + junk.sub("", uri[pos:pos + chunk_chars])
+        usable = len(piece) - len(piece) % 4
+        yield base64.b64decode(piece[:usable])
+        pending = piece[usable:]
+    if pending:
+        yield base64.b64decode(pending + "=" * (-len(pending) % 4))
+
+
+# --- DOWNLOADS ---
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class DownloadError(Exception):
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class DownloadCancelled(DownloadError):
+    pass
+
+
+class DownloadTooLarge(DownloadError):
+    pass
+
+
+class ConnectionPool:
+    # Idle keep-alive http.client connections per (scheme, host, port), shared by workers
+    def __init__(self, timeout=30, max_idle_per_host=2):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.ssl_context = None
+
+    def acquire(self, key):
+        with self.lock:
+            conns = self.idle.get(key)
+            conn = conns.pop() if conns else None
+        if conn is not None:
+            if conn.sock is not None:
+                conn.sock.settimeout(self.timeout)
+            return conn, True
+        import http.client
+        scheme, host, port = key
+        if scheme == "https":
+            if self.ssl_context is None:
+                import ssl
+                self.ssl_context = ssl.create_default_context()
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def release(self, key, conn, response):
+        # Only fully read responses on persistent connections can be reused
+        if response.will_close or not response.isclosed():
+            conn.close()
+            return
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            if len(conns) < self.max_idle_per_host:
+                conns.append(conn)
+                return
+        conn.close()
+
+    def close_all(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+def open_url(pool, url, max_redirects=5):
+    import http.client
+    for _ in range(max_redirects + 1):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise DownloadError(f"unsupported URL: {url}")
+        key = (parts.scheme, parts.hostname, parts.port)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        conn, reused = pool.acquire(key)
+        try:
+            conn.request("GET", target, headers={'User-Agent': 'Mozilla/5.0', 'Accept-Encoding': 'identity'})
+            response = conn.getresponse()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            if reused:
+                # The server dropped an idle keep-alive socket; go again on a fresh one
+                continue
+            raise DownloadError(str(e), retryable=True)
+        location = response.getheader("Location")
+        if response.status in REDIRECT_STATUSES and location:
+            response.read()
+            pool.release(key, conn, response)
+            url = urljoin(url, location)
+            continue
+        if response.status != 200:
+            conn.close()
+            raise DownloadError(f"HTTP {response.status}", retryable=response.status >= 500 or response.status == 429)
+        return key, conn, response
+    raise DownloadError(f"too many redirects: {url}")
+
+
+def stream_download(url, dest, max_bytes, timeout, progress=None, cancel_event=None, chunk_size=64 * 1024, pool=None):
+    # Streams the response to dest + ".part" in fixed-size chunks and renames it into place
+    # only when complete. progress(done, total) is called from this (worker) thread;
+    # total is None when the server sends no Content-Length.
+    import http.client
+    own_pool = pool is None
+    if own_pool:
+        pool = ConnectionPool(timeout)
+    tmp = dest + ".part"
+    try:
+        key, conn, response = open_url(pool, url)
+        try:
+            length = response.getheader("Content-Length", "")
+            total = int(length) if length.isdigit() else None
+            if total is not None and total > max_bytes:
+                raise DownloadTooLarge(f"{total} bytes exceeds the {max_bytes} byte limit")
+            done = 0
+            with open(tmp, "wb") as f:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise DownloadCancelled(url)
+                    try:
+                        chunk = response.read(chunk_size)
+                    except (OSError, http.client.HTTPException) as e:
+                        raise DownloadError(str(e), retryable=True)
+                    if not chunk:
+                        break
+                    done += len(chunk)
+                    if done > max_bytes:
+                        raise DownloadTooLarge(f"response exceeds the {max_bytes} byte limit")
+                    f.write(chunk)
+                    if progress:
+                        progress(done, total)
+            if total is not None and done < total:
+                raise DownloadError(f"connection closed after {done} of {total} bytes", retryable=True)
+            os.replace(tmp, dest)
+        except BaseException:
+            conn.close()
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        pool.release(key, conn, response)
+        return done
+    finally:
+        if own_pool:
+            pool.close_all()
+
+
+class DownloadJob:
+    __slots__ = ("url", "host", "filename", "dest", "max_bytes", "cancel_event", "done", "total")
+
+    def __init__(self, url, filename, dest, max_bytes, cancel_event):
+        self.url = url
+        self.host = urlsplit(url).netloc
+        self.filename = filename
+        self.dest = dest
+        self.max_bytes = max_bytes
+        self.cancel_event = cancel_event
+        self.done = 0
+        self.total = None
+
+
+class DownloadManager:
+    # Runs downloads on a bounded set of worker threads with a per-host limit, reusing
+    # keep-alive connections through ConnectionPool. Identical URLs already queued or running
+    # are not downloaded twice, transient failures are retried with exponential backoff, and
+    # progress is reported for the whole batch rather than per file. Callbacks run on workers.
+    def __init__(self, download_dir, on_progress, on_finished, max_workers=6, per_host=2, retries=3, backoff=0.5):
+        self.download_dir = download_dir
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.pool = ConnectionPool()
+        self.cond = threading.Condition()
+        self.pending = deque()
+        self.jobs = {}  # url -> job, queued or running
+        self.host_active = {}
+        self.workers = 0
+        self.idle_workers = 0
+        self.cancel_event = threading.Event()
+        self.counter = 0
+        self.last_report = 0.0
+        self._reset_totals()
+
+    def _reset_totals(self):
+        self.batch_jobs = 0
+        self.batch_finished = 0
+        self.batch_failed = 0
+        self.batch_bytes = 0  # bytes of jobs already finished
+
+    def submit(self, url, filename, max_bytes, timeout):
+        with self.cond:
+            if url in self.jobs:
+                return False
+            self.pool.timeout = timeout
+            self.counter += 1
+            dest = os.path.join(self.download_dir, f"{self.counter}-{os.getpid()}.download")
+            job = DownloadJob(url, filename, dest, max_bytes, self.cancel_event)
+            self.jobs[url] = job
+            self.pending.append(job)
+            self.batch_jobs += 1
+            if self.idle_workers == 0 and self.workers < self.max_workers:
+                self.workers += 1
+                threading.Thread(target=self._worker, name="download", daemon=True).start()
+            self.cond.notify_all()
+        return True
+
+    def busy(self):
+        with self.cond:
+            return bool(self.jobs)
+
+    def cancel_all(self):
+        with self.cond:
+            self.cancel_event.set()
+            self.cancel_event = threading.Event()
+            self.cond.notify_all()
+
+    def snapshot(self):
+        with self.cond:
+            running = [job for job in self.jobs.values()]
+            done = self.batch_bytes + sum(job.done for job in running)
+            total = self.batch_bytes + sum(job.total or job.done for job in running)
+            return {
+                "jobs": self.batch_jobs,
+                "finished": self.batch_finished,
+                "failed": self.batch_failed,
+                "bytes_done": done,
+                "bytes_total": total,
+            }
+
+    def _next_job(self):
+        # First queued job whose host is below its connection limit
+        for job in self.pending:
+            if self.host_active.get(job.host, 0) < self.per_host:
+                self.pending.remove(job)
+                return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self.cond:
+                job = self._next_job()
+                while job is None:
+                    self.idle_workers += 1
+                    self.cond.wait()
+                    self.idle_workers -= 1
+                    job = self._next_job()
+                self.host_active[job.host] = self.host_active.get(job.host, 0) + 1
+            # Whatever a job or its callback raises, the bookkeeping must run and the worker
+            # must live on, or busy() stays True and the batch is never reported
+            error = "Download failed"
+            try:
+                error = self._run(job)
+            except Exception as e:
+                print(f"[DOWNLOAD] {job.url}: {e}", file=sys.stderr)
+            finally:
+                with self.cond:
+                    self.host_active[job.host] -= 1
+                    del self.jobs[job.url]
+                    self.batch_finished += 1
+                    if error:
+                        self.batch_failed += 1
+                    else:
+                        self.batch_bytes += job.done
+                    all_done = not self.jobs
+                    self.cond.notify_all()
+            try:
+                self.on_finished(job, None if error else job.dest, error)
+            except Exception as e:
+                print(f"[DOWNLOAD] {job.url}: {e}", file=sys.stderr)
+            if all_done:
+                self.on_progress(self.snapshot())
+                with self.cond:
+                    if not self.jobs:
+                        self._reset_totals()
+
+    @traced("download.job")
+    def _run(self, job):
+        os.makedirs(self.download_dir, exist_ok=True)
+        for attempt in range(self.retries + 1):
+            if job.cancel_event.is_set():
+                return "Download cancelled"
+            try:
+                stream_download(job.url, job.dest, job.max_bytes, self.pool.timeout,
+                                lambda done, total: self._progress(job, done, total),
+                                job.cancel_event, pool=self.pool)
+                return None
+            except DownloadCancelled:
+                return "Download cancelled"
+            except DownloadTooLarge:
+                return "Download too large"
+            except DownloadError as e:
+                if not e.retryable or attempt == self.retries:
+                    return "Download failed"
+            except Exception:
+                if attempt == self.retries:
+                    return "Download failed"
+            # Exponential backoff with jitter; wakes early on cancel
+            import random
+            job.done = 0
+            job.cancel_event.wait(self.backoff * (2 ** attempt) * (1 + random.random()))
+        return "Download failed"
+
+    def _progress(self, job, done, total):
+        job.done = done
+        job.total = total
+        now = time.monotonic()
+        if now - self.last_report >= 0.2:
+            self.last_report = now
+            self.on_progress(self.snapshot())
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.close_all()
+
+
+def format_size(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+# --- FILE MONITORING ---
+class ShelfWatcher:
+    # One Gio.FileMonitor per parent directory, shared by every shelved file in it, so
+    # thousands of items from a few folders cost a few inotify watches. Directories past
+    # max_dirs are left unwatched. Events are coalesced for delay_ms into one callback:
+    # on_changes(changed paths, deleted paths, {old path: new path}).
+    def __init__(self, on_changes, max_dirs=512, delay_ms=300):
+        self.on_changes = on_changes
+        self.max_dirs = max_dirs
+        self.delay_ms = delay_ms
+        self.dirs = {}  # directory -> [monitor, number of shelved files in it]
+        self.pending = {}  # path -> "changed" | "deleted", last event wins
+        self.renames = {}
+        self.flush_id = 0
+
+    def watch(self, path):
+        directory = os.path.dirname(path)
+        entry = self.dirs.get(directory)
+        if entry:
+            entry[1] += 1
+            return
+        if len(self.dirs) >= self.max_dirs:
+            return
+        try:
+            monitor = Gio.File.new_for_path(directory).monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        except GLib.Error:
+            return
+        monitor.connect("changed", self._on_event)
+        self.dirs[directory] = [monitor, 1]
+
+    def covers(self, path):
+        return os.path.dirname(path) in self.dirs
+
+    def unwatch(self, path):
+        directory = os.path.dirname(path)
+        entry = self.dirs.get(directory)
+        if not entry:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            entry[0].cancel()
+            del self.dirs[directory]
+
+    def clear(self):
+        for monitor, _ in self.dirs.values():
+            monitor.cancel()
+        self.dirs.clear()
+        self.pending.clear()
+        self.renames.clear()
+
+    def _on_event(self, monitor, gfile, other, event):
+        path = gfile.get_path()
+        if not path:
+            return
+        E = Gio.FileMonitorEvent
+        if event in (E.RENAMED, E.MOVED_OUT) and other is not None and other.get_path():
+            new_path = other.get_path()
+            # Follow chains (a -> b -> c) within one burst
+            for old, target in self.renames.items():
+                if target == path:
+                    self.renames[old] = new_path
+                    break
+            else:
+                self.renames[path] = new_path
+            self.pending[new_path] = "changed"
+        elif event in (E.DELETED, E.MOVED_OUT):
+            self.pending[path] = "deleted"
+        elif event in (E.CHANGES_DONE_HINT, E.CREATED, E.MOVED_IN, E.ATTRIBUTE_CHANGED):
+            self.pending[path] = "changed"
+        else:
+            return
+        if not self.flush_id:
+            self.flush_id = GLib.timeout_add(self.delay_ms, self._flush)
+
+    def _flush(self):
+        self.flush_id = 0
+        pending, renames = self.pending, self.renames
+        self.pending, self.renames = {}, {}
+        changed = {p for p, kind in pending.items() if kind == "changed"}
+        deleted = {p for p, kind in pending.items() if kind == "deleted"}
+        self.on_changes(changed, deleted, renames)
+        return False
+
+
+# --- CONTENT SEARCH ---
+class ContentIndex:
+    # Trigram index over the text of shelved files, maintained by a background thread.
+    # Queries intersect trigram postings, which is exact for a three-byte query. Longer
+    # queries get those candidates at once and the index thread then confirms them with a
+    # regex over an mmap, posting the narrowed set back to the main loop, so typing never
+    # scans file contents on the main loop. Matching is ASCII case-insensitive.
+    def __init__(self, on_updated, max_file_bytes=16 * 1024 * 1024, chunk_size=1024 * 1024):
+        self.on_updated = on_updated
+        self.max_file_bytes = max_file_bytes
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.docs = {}  # path -> (mtime_ns, size, trigrams)
+        self.postings = {}  # trigram -> set of paths
+        self.jobs = queue.Queue()
+        self.dirty = False
+        self.notify_pending = False
+        self.generation = 0  # bumped by every search; stale verifications are dropped
+        threading.Thread(target=self._worker, name="content-index", daemon=True).start()
+
+    def update(self, path):
+        # Indexes new files and re-indexes ones whose mtime/size changed
+        self.jobs.put(("index", path))
+
+    def discard(self, path):
+        self.jobs.put(("drop", path))
+
+    def clear(self):
+        with self.lock:
+            self.docs.clear()
+            self.postings.clear()
+
+    def search(self, query, on_verified):
+        # None means the query is too short for the index. Otherwise returns the candidate
+        # paths; for queries longer than a trigram, on_verified(matches) later runs on the
+        # main loop with the subset that really contains the query, unless a newer search
+        # came first.
+        self.generation += 1
+        needle = query.lower().encode("utf-8")
+        if len(needle) < 3:
+            return None
+        grams = {needle[i:i + 3] for i in range(len(needle) - 2)}
+        with self.lock:
+            sets = [self.postings.get(g) for g in grams]
+            if not all(sets):
+                return set()
+            sets.sort(key=len)
+            candidates = set(sets[0]).intersection(*sets[1:])
+        if len(needle) > 3 and candidates:
+            self.jobs.put(("verify", (self.generation, needle, frozenset(candidates), on_verified)))
+        return candidates
+
+    def _verify(self, generation, needle, candidates, on_verified):
+        import re
+        pattern = re.compile(re.escape(needle), re.IGNORECASE)
+        found = set()
+        for path in candidates:
+            if generation != self.generation:
+                return
+            if self._contains(path, pattern):
+                found.add(path)
+        GLib.idle_add(self._deliver, generation, on_verified, found)
+
+    def _deliver(self, generation, on_verified, found):
+        if generation == self.generation:
+            on_verified(found)
+        return False
+
+    def _contains(self, path, pattern):
+        import mmap
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return pattern.search(m) is not None
+        except (OSError, ValueError):
+            return False
+
+    def _worker(self):
+        while True:
+            kind, arg = self.jobs.get()
+            try:
+                if kind == "verify":
+                    self._verify(*arg)
+                else:
+                    changed = self._index(arg) if kind == "index" else self._drop(arg)
+                    self.dirty = self.dirty or changed
+            except Exception:
+                pass
+            if self.dirty and self.jobs.empty() and not self.notify_pending:
+                self.dirty = False
+                self.notify_pending = True
+                GLib.idle_add(self._notify)
+
+    def _notify(self):
+        self.notify_pending = False
+        self.on_updated()
+        return False
+
+    def _index(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return self._drop(path)
+        doc = self.docs.get(path)
+        if doc and doc[0] == st.st_mtime_ns and doc[1] == st.st_size:
+            return False
+        trigrams = frozenset()
+        if 0 < st.st_size <= self.max_file_bytes:
+            trigrams = self._trigrams(path)
+        with self.lock:
+            self._unlink(path)
+            self.docs[path] = (st.st_mtime_ns, st.st_size, trigrams)
+            for gram in trigrams:
+                self.postings.setdefault(gram, set()).add(path)
+        return True
+
+    def _drop(self, path):
+        with self.lock:
+            if path not in self.docs:
+                return False
+            self._unlink(path)
+            del self.docs[path]
+        return True
+
+    def _unlink(self, path):
+        doc = self.docs.get(path)
+        if not doc:
+            return
+        for gram in doc[2]:
+            paths = self.postings.get(gram)
+            if paths:
+                paths.discard(path)
+                if not paths:
+                    del self.postings[gram]
+
+    def _trigrams(self, path):
+        import mmap
+        grams = set()
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            # Binary files (images, archives...) are skipped
+            if b"\0" in m[:4096]:
+                return frozenset()
+            size = len(m)
+            step = self.chunk_size
+            for start in range(0, size, step):
+                # Overlap by two bytes so trigrams spanning chunk borders are kept
+                chunk = m[start:start + step + 2].lower()
+                grams.update(chunk[i:i + 3] for i in range(len(chunk) - 2))
+        return frozenset(grams)
+
+
+# --- THUMBNAILS ---
+THUMBNAIL_EXTENSIONS = ('.jpg', '.png', '.jpeg', '.webp')
+# GdkPixbuf loaders that can decode straight at a reduced size; every other format is
+# decoded at full resolution before scaling, so it gets a pixel cap instead
+SCALED_DECODE_FORMATS = ("jpeg",)
+MAX_FULL_DECODE_PIXELS = 16 * 1000 * 1000
+
+def is_thumbnailable(filename):
+    return filename.lower().endswith(THUMBNAIL_EXTENSIONS)
+
+def file_stamp(path):
+    # What a cached thumbnail of path is only valid for; None if the file is gone
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def cover_size(w, h, target_size):
+    # Smallest size that still "covers" the target square, forcing AT LEAST target_size
+    scale = max(target_size / w, target_size / h)
+    return max(int(w * scale), target_size), max(int(h * scale), target_size)
+
+def crop_center(pb, target_size):
+    real_w = pb.get_width()
+    real_h = pb.get_height()
+    x_off = min(max((real_w - target_size) // 2, 0), max(real_w - target_size, 0))
+    y_off = min(max((real_h - target_size) // 2, 0), max(real_h - target_size, 0))
+    # copy() so the scaled parent pixbuf can be freed right away
+    return pb.new_subpixbuf(x_off, y_off, min(target_size, real_w), min(target_size, real_h)).copy()
+
+def render_thumbnail(path, target_size, chunk_size=256 * 1024):
+    # Runs on a worker thread: only GdkPixbuf here, textures are made on the main loop.
+    # The loader is told the final size as soon as the header is parsed, so loaders that
+    # support it (JPEG) decode straight at reduced scale and never hold the full bitmap.
+    # Others (PNG, WebP) allocate the full bitmap anyway; above MAX_FULL_DECODE_PIXELS they
+    # are not decoded at all and the row keeps its icon.
+    if not os.path.exists(path):
+        return None
+    fmt, width, height = GdkPixbuf.Pixbuf.get_file_info(path)
+    if fmt is None:
+        return None
+    if fmt.get_name() not in SCALED_DECODE_FORMATS and width * height > MAX_FULL_DECODE_PIXELS:
+        return None
+    loader = GdkPixbuf.PixbufLoader()
+    loader.connect("size-prepared", lambda ldr, w, h: ldr.set_size(*cover_size(w, h, target_size)))
+    try:
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                loader.write(chunk)
+    finally:
+        loader.close()
+    pb = loader.get_pixbuf()
+    if pb is None:
+        return None
+    return crop_center(pb, target_size)
+
+
+class ThumbnailDiskCache:
+    # Cover-cropped thumbnails saved as PNG, validated against the source mtime/size
+    # (stored as tEXt chunks, like the freedesktop thumbnail spec) and trimmed to max_bytes.
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = None
+
+    def entry_path(self, path, size):
+        key = hashlib.md5(f"{size}:{path}".encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.directory, key + ".png")
+
+    def lookup(self, path, st, size):
+        entry = self.entry_path(path, size)
+        try:
+            pb = GdkPixbuf.Pixbuf.new_from_file(entry)
+        except GLib.Error:
+            return None
+        if pb.get_option("tEXt::Thumb::MTime") != str(st.st_mtime_ns) or \
+                pb.get_option("tEXt::Thumb::Size") != str(st.st_size):
+            return None
+        try:
+            # Touch so eviction drops the least recently used entries first
+            os.utime(entry)
+        except OSError:
+            pass
+        return pb
+
+    def store(self, path, st, size, pixbuf):
+        entry = self.entry_path(path, size)
+        tmp = f"{entry}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            pixbuf.savev(tmp, "png",
+                         ["tEXt::Thumb::URI", "tEXt::Thumb::MTime", "tEXt::Thumb::Size"],
+                         [GLib.filename_to_uri(path, None), str(st.st_mtime_ns), str(st.st_size)])
+            try:
+                # A stale entry for the same file is overwritten, not added to
+                replaced = os.path.getsize(entry)
+            except OSError:
+                replaced = 0
+            os.replace(tmp, entry)
+            written = os.path.getsize(entry)
+        except (GLib.Error, OSError):
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self._scan_size()
+            else:
+                self.total_bytes += written - replaced
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def reset(self):
+        with self.lock:
+            self.total_bytes = None
+
+    def _entries(self):
+        try:
+            with os.scandir(self.directory) as it:
+                return [(e.path, e.stat()) for e in it if e.name.endswith(".png")]
+        except OSError:
+            return []
+
+    def _scan_size(self):
+        return sum(st.st_size for _, st in self._entries())
+
+    def _evict(self):
+        # Drop oldest entries until we are back under 80% of the cap
+        entries = sorted(self._entries(), key=lambda e: e[1].st_mtime)
+        total = sum(st.st_size for _, st in entries)
+        limit = self.max_bytes * 0.8
+        for entry, st in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(entry)
+                total -= st.st_size
+            except OSError:
+                pass
+        self.total_bytes = total
+
+
+class TextureCache:
+    # LRU of ready-to-paint textures keyed by FileItem.path, bounded by an approximate byte budget.
+    # Each entry remembers the file_stamp() it was decoded from. Lookups never stat: edits are
+    # invalidated by ShelfWatcher, and files it does not cover are re-checked on a worker.
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()  # path -> (texture, nbytes, stamp)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path):
+        entry = self.entries.get(path)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(path)
+        self.hits += 1
+        return entry[0]
+
+    def stamp(self, path):
+        entry = self.entries.get(path)
+        return entry[2] if entry else None
+
+    def put(self, path, texture, stamp):
+        nbytes = texture.get_width() * texture.get_height() * 4
+        self.invalidate(path)
+        self.entries[path] = (texture, nbytes, stamp)
+        self.total_bytes += nbytes
+        self._trim()
+
+    def invalidate(self, path):
+        entry = self.entries.pop(path, None)
+        if entry:
+            self.total_bytes -= entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def set_budget(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self._trim()
+
+    def _trim(self):
+        while self.total_bytes > self.budget_bytes and self.entries:
+            _, (_, nbytes, _) = self.entries.popitem(last=False)
+            self.total_bytes -= nbytes
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.total_bytes,
+            "budget_bytes": self.budget_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ThumbnailRequest:
+    __slots__ = ("path", "callback", "known_stamp", "future", "cancelled")
+
+    def __init__(self, path, callback, known_stamp=None):
+        self.path = path
+        self.callback = callback
+        self.known_stamp = known_stamp
+        self.future = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future:
+            self.future.cancel()
+
+
+class ThumbnailEngine:
+    # Decodes thumbnails on a small fixed pool so binding a row never blocks the main loop.
+    # Results are delivered with GLib.idle_add; cancelled requests are dropped on either side.
+    def __init__(self, target_size, disk_cache=None, max_workers=2):
+        self.target_size = target_size
+        self.disk_cache = disk_cache
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="thumbnail")
+
+    def request(self, path, callback, known_stamp=None):
+        # With known_stamp, the caller already shows a thumbnail made at that stamp: the result
+        # is None unless the file has changed since
+        req = ThumbnailRequest(path, callback, known_stamp)
+        try:
+            req.future = self.executor.submit(self._decode, req)
+        except RuntimeError:
+            # Executor already shut down (app is quitting)
+            req.cancelled = True
+        return req
+
+    def _decode(self, req):
+        if req.cancelled:
+            return
+        try:
+            pixbuf, stamp = self._load(req.path, req.known_stamp)
+        except Exception:
+            pixbuf, stamp = None, None
+        if not req.cancelled:
+            GLib.idle_add(self._deliver, req, pixbuf, stamp)
+
+    def _load(self, path, known_stamp=None):
+        # Returns the pixbuf and the file_stamp() of the file it was made from
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None, None
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == known_stamp:
+            return None, stamp
+        if self.disk_cache:
+            pixbuf = self.disk_cache.lookup(path, st, self.target_size)
+            if pixbuf:
+                return pixbuf, stamp
+        pixbuf = render_thumbnail(path, self.target_size)
+        if pixbuf and self.disk_cache:
+            self.disk_cache.store(path, st, self.target_size, pixbuf)
+        return pixbuf, stamp
+
+    def _deliver(self, req, pixbuf, stamp):
+        if not req.cancelled:
+            req.callback(req.path, pixbuf, stamp)
+        return False
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- PERSISTENCE ---
+def state_dir():
+    return os.path.join(os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state"), "dropshelf")
+
+def write_file_atomic(path, data):
+    # Write next to the target, fsync, then rename over it: readers see old or new, never half
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    try:
+        dir_fd = os.open(os.path.dirname(path), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+
+class StatePersister:
+    # Coalesces save requests made within delay_ms into one write. The snapshot is taken on
+    # the main loop; serialising and writing happen on a single writer thread.
+    def __init__(self, path, snapshot, delay_ms=500):
+        self.path = path
+        self.snapshot = snapshot
+        self.delay_ms = delay_ms
+        self.dirty = False
+        self.timeout_id = 0
+        self.last_write = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="state")
+
+    def schedule(self):
+        self.dirty = True
+        if not self.timeout_id:
+            self.timeout_id = GLib.timeout_add(self.delay_ms, self._on_timeout)
+
+    def _on_timeout(self):
+        self.timeout_id = 0
+        if self.dirty:
+            self.dirty = False
+            self.last_write = self.executor.submit(self._write, self.snapshot())
+        return False
+
+    @traced("state.write")
+    def _write(self, data):
+        try:
+            write_file_atomic(self.path, encode_state(data))
+        except Exception as e:
+            print(f"[STATE] Failed to save {self.path}: {e}", file=sys.stderr)
+
+    def flush(self):
+        # Called on quit: wait for the writer, then write anything still pending synchronously
+        if self.timeout_id:
+            GLib.source_remove(self.timeout_id)
+            self.timeout_id = 0
+        if self.last_write:
+            self.last_write.result()
+            self.last_write = None
+        if self.dirty:
+            self.dirty = False
+            self._write(self.snapshot())
+
+
+def encode_state(data):
+    items, settings = data
+    return json.dumps({
+        "items": [{"path": path, "filename": filename, "pinned": pinned} for path, filename, pinned in items],
+        "settings": settings,
+    }, separators=(",", ":")).encode("utf-8")
+
+
+class JsonShelfStorage:
+    # The default backend: the whole shelf as one state.json, rewritten through StatePersister
+    def __init__(self, path, legacy_path, snapshot):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.snapshot = snapshot
+        self.rows = []
+        self.restored = 0
+        self.persister = StatePersister(path, self._snapshot)
+
+    def load(self):
+        path = self.path if os.path.exists(self.path) else self.legacy_path
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None, iter(())
+        self.rows = [(d['path'], d.get('pinned', False)) for d in data.get("items", []) if d.get('path')]
+        self.restored = 0
+        return data.get("settings"), self._pages()
+
+    def _pages(self, page_size=1000):
+        while self.restored < len(self.rows):
+            page = self.rows[self.restored:self.restored + page_size]
+            # The caller commits the page to the store before anything can snapshot
+            self.restored += len(page)
+            yield page
+        self.rows, self.restored = [], 0
+
+    def _snapshot(self):
+        items, settings = self.snapshot()
+        # Rows not yet restored into the store still belong in the file
+        items.extend((path, os.path.basename(path), pinned) for path, pinned in self.rows[self.restored:])
+        return items, settings
+
+    def items_changed(self, added, removed):
+        self.persister.schedule()
+
+    def item_updated(self, item):
+        self.persister.schedule()
+
+    def item_renamed(self, old_path, item):
+        self.persister.schedule()
+
+    def settings_changed(self, settings):
+        self.persister.schedule()
+
+    def clear(self):
+        self.rows, self.restored = [], 0
+        self.persister.schedule()
+
+    def flush(self):
+        self.persister.flush()
+
+
+class SqliteShelfStorage:
+    # Optional backend for very large shelves: one row per item in a WAL-mode database.
+    # Mutations become small row writes executed by a writer thread in one transaction
+    # per burst; startup pages rows out by id instead of parsing a single document.
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = self._connect()
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY,
+                    path TEXT NOT NULL UNIQUE,
+                    filename TEXT NOT NULL,
+                    pinned INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS items_pinned ON items (pinned);
+                CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """)
+        self.writes = queue.Queue()
+        threading.Thread(target=self._writer, name="sqlite-writer", daemon=True).start()
+
+    def _connect(self):
+        import sqlite3
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def migrate_from_json(self, json_paths):
+        # One-time import of an existing state.json, which is then renamed out of the way
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'migrated'").fetchone():
+            return
+        for json_path in json_paths:
+            if not os.path.exists(json_path):
+                continue
+            try:
+                with open(json_path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            rows = [(d['path'], os.path.basename(d['path']), int(bool(d.get('pinned', False))))
+                    for d in data.get("items", []) if d.get('path')]
+            with self.conn:
+                self.conn.executemany("INSERT OR IGNORE INTO items (path, filename, pinned) VALUES (?, ?, ?)", rows)
+                self.conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                                      [(k, json.dumps(v)) for k, v in (data.get("settings") or {}).items()])
+            try:
+                os.replace(json_path, json_path + ".migrated")
+            except OSError:
+                pass
+            break
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', '1')")
+
+    def load(self):
+        import sqlite3
+        try:
+            settings = {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM settings")}
+        except sqlite3.Error as e:
+            raise OSError(f"cannot read {self.path}: {e}") from e
+        return settings or None, self._pages()
+
+    def _pages(self, page_size=1000):
+        last_id = 0
+        while True:
+            rows = self.conn.execute("SELECT id, path, pinned FROM items WHERE id > ? ORDER BY id LIMIT ?",
+                                     (last_id, page_size)).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [(path, bool(pinned)) for _, path, pinned in rows]
+
+    def _writer(self):
+        import sqlite3
+        conn = self._connect()
+        while True:
+            ops = [self.writes.get()]
+            while True:
+                try:
+                    ops.append(self.writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._apply(conn, ops)
+            except sqlite3.Error as e:
+                print(f"[STATE] SQLite write failed: {e}", file=sys.stderr)
+            for _ in ops:
+                self.writes.task_done()
+
+    @traced("state.sqlite_write")
+    def _apply(self, conn, ops):
+        with conn:
+            for sql, rows in ops:
+                conn.executemany(sql, rows)
+
+    def items_changed(self, added, removed):
+        if removed:
+            self.writes.put(("DELETE FROM items WHERE path = ?", [(item.path,) for item in removed]))
+        if added:
+            self.writes.put(("INSERT OR IGNORE INTO items (path, filename, pinned) VALUES (?, ?, ?)",
+                             [(item.path, item.filename, int(item.pinned)) for item in added]))
+
+    def item_updated(self, item):
+        self.writes.put(("UPDATE items SET pinned = ? WHERE path = ?", [(int(item.pinned), item.path)]))
+
+    def item_renamed(self, old_path, item):
+        self.writes.put(("UPDATE OR REPLACE items SET path = ?, filename = ? WHERE path = ?",
+                         [(item.path, item.filename, old_path)]))
+
+    def settings_changed(self, settings):
+        self.writes.put(("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                         [(k, json.dumps(v)) for k, v in settings.items()]))
+
+    def clear(self):
+        self.writes.put(("DELETE FROM items", [()]))
+
+    def flush(self):
+        self.writes.join()
+
+
+def open_storage(snapshot):
+    # DROPSHELF_STORAGE=sqlite|json picks the backend; otherwise an existing shelf.db wins
+    state_file = os.path.join(state_dir(), "state.json")
+    # Older builds kept state.json in whatever directory the app was started from
+    legacy_state_file = os.path.join(os.getcwd(), "state.json")
+    db_file = os.path.join(state_dir(), "shelf.db")
+    backend = os.environ.get("DROPSHELF_STORAGE") or ("sqlite" if os.path.exists(db_file) else "json")
+    if backend == "sqlite":
+        storage = SqliteShelfStorage(db_file)
+        storage.migrate_from_json([state_file, legacy_state_file])
+        return storage
+    return JsonShelfStorage(state_file, legacy_state_file, snapshot)
+
+
+# --- CSV COLLECTOR ---
+CSV_OPTIONAL_COLUMNS = ("timestamp", "source")
+
+
+class CsvCollector:
+    # Buffers rows collected in csv_mode and appends them with the csv module in batches:
+    # on a timer, when the buffer is large, and on quit. Once the file passes max_bytes it
+    # is renamed aside with a timestamp and a fresh collected.csv is started.
+    def __init__(self, directory, on_file, columns=("text",), max_bytes=10 * 1024 * 1024,
+                 flush_ms=1000, max_rows=500):
+        self.directory = directory
+        self.path = os.path.join(directory, "collected.csv")
+        self.on_file = on_file
+        self.columns = tuple(columns)
+        self.max_bytes = max_bytes
+        self.flush_ms = flush_ms
+        self.max_rows = max_rows
+        self.rows = []
+        self.timeout_id = 0
+
+    def add(self, text, source):
+        import datetime
+        values = {
+            "text": text,
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "source": source,
+        }
+        self.rows.append([values[c] for c in self.columns])
+        if len(self.rows) >= self.max_rows:
+            self.flush()
+        elif not self.timeout_id:
+            self.timeout_id = GLib.timeout_add(self.flush_ms, self.flush)
+
+    def set_columns(self, columns):
+        columns = tuple(columns)
+        if columns == self.columns:
+            return
+        # Rows already buffered keep the old layout, and so does the file they go to
+        self.flush()
+        self.columns = columns
+        self.roll_over()
+
+    def set_max_bytes(self, max_bytes):
+        self.max_bytes = max_bytes
+
+    def flush(self):
+        if self.timeout_id:
+            GLib.source_remove(self.timeout_id)
+            self.timeout_id = 0
+        if not self.rows:
+            return False
+        rows, self.rows = self.rows, []
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                self.roll_over()
+            os.makedirs(self.directory, exist_ok=True)
+            is_new = not os.path.exists(self.path)
+            import csv
+            with open(self.path, "a", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+                if is_new and self.columns != ("text",):
+                    writer.writerow(self.columns)
+                writer.writerows(rows)
+        except OSError as e:
+            print(f"[CSV] Failed to write {self.path}: {e}", file=sys.stderr)
+            return False
+        self.on_file(self.path)
+        return False
+
+    def roll_over(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        import datetime
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        rolled = os.path.join(self.directory, f"collected-{stamp}.csv")
+        c = 1
+        while os.path.exists(rolled):
+            rolled = os.path.join(self.directory, f"collected-{stamp}_{c}.csv")
+            c += 1
+        os.replace(self.path, rolled)
+        self.on_file(rolled)
+
+    def discard(self):
+        if self.timeout_id:
+            GLib.source_remove(self.timeout_id)
+            self.timeout_id = 0
+        self.rows = []
+
+
+# --- ARCHIVES ---
+ARCHIVE_FORMATS = {"zip": ".zip", "tar.gz": ".tar.gz"}
+# mkstemp creates files as 0600; archives get the mode a plain open() would have given them.
+# Read once at import, while nothing else can be creating files
+_umask = os.umask(0o022)
+os.umask(_umask)
+ARCHIVE_MODE = 0o666 & ~_umask
+# Already compressed: deflating these again costs CPU and saves next to nothing
+COMPRESSED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.heic', '.avif',
+                         '.mp3', '.ogg', '.opus', '.m4a', '.flac', '.mp4', '.mkv', '.webm', '.mov',
+                         '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar',
+                         '.docx', '.xlsx', '.pptx', '.odt', '.ods', '.odp', '.epub', '.jar', '.apk')
+
+
+class ArchiveCancelled(Exception):
+    pass
+
+
+def iter_archive_members(paths):
+    # (source path, name in the archive) for every regular file. Directories are walked under
+    # their own name; clashing top-level names become "name (2).ext", "name (3).ext"...
+    used = set()
+    for path in paths:
+        base = os.path.basename(path.rstrip(os.sep)) or "file"
+        stem, ext = os.path.splitext(base)
+        name, n = base, 2
+        while name in used:
+            name, n = f"{stem} ({n}){ext}", n + 1
+        used.add(name)
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                rel = os.path.relpath(root, path)
+                prefix = name if rel == "." else f"{name}/{rel.replace(os.sep, '/')}"
+                for f in sorted(files):
+                    src = os.path.join(root, f)
+                    if os.path.isfile(src):
+                        yield src, f"{prefix}/{f}"
+        elif os.path.isfile(path):
+            yield path, name
+
+
+class ProgressReader:
+    # Wraps a source file so the archive writers report progress and can be cancelled
+    # between reads
+    def __init__(self, f, on_read, cancel_event=None):
+        self.f = f
+        self.on_read = on_read
+        self.cancel_event = cancel_event
+
+    def read(self, size=-1):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ArchiveCancelled()
+        data = self.f.read(size)
+        self.on_read(len(data))
+        return data
+
+
+def write_archive(members, fileobj, fmt, progress=None, cancel_event=None, store_compressed=True,
+                  chunk_size=1024 * 1024):
+    # Streams each source file into the archive chunk by chunk; nothing is copied aside first.
+    # progress(done, total) is called from the calling (worker) thread. store_compressed only
+    # applies to zip, where every member picks its own method; tar.gz compresses the stream.
+    members = list(members)
+    total = 0
+    for src, _ in members:
+        try:
+            total += os.path.getsize(src)
+        except OSError:
+            pass
+    done = 0
+
+    def on_read(n):
+        nonlocal done
+        done += n
+        if progress:
+            progress(done, total)
+
+    if fmt == "zip":
+        import shutil
+        import zipfile
+        # Non-strict timestamps: files dated before 1980 (epoch mtimes) are clamped, not refused
+        with zipfile.ZipFile(fileobj, "w", allowZip64=True, strict_timestamps=False) as zf:
+            for src, name in members:
+                info = zipfile.ZipInfo.from_file(src, name, strict_timestamps=False)
+                if store_compressed and name.lower().endswith(COMPRESSED_EXTENSIONS):
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                with open(src, "rb") as f, zf.open(info, "w") as dst:
+                    shutil.copyfileobj(ProgressReader(f, on_read, cancel_event), dst, chunk_size)
+    elif fmt == "tar.gz":
+        import tarfile
+        with tarfile.open(fileobj=fileobj, mode="w:gz", compresslevel=6) as tf:
+            for src, name in members:
+                info = tf.gettarinfo(src, name)
+                with open(src, "rb") as f:
+                    tf.addfile(info, ProgressReader(f, on_read, cancel_event))
+    else:
+        raise ValueError(f"unknown archive format: {fmt}")
+
+
+def build_archive(paths, dest, fmt, progress=None, cancel_event=None, store_compressed=True):
+    # Written next to dest and renamed into place, so dest only ever holds a whole archive.
+    # The .part name is unique, so two exports to the same file cannot write into each other
+    import tempfile
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), prefix=os.path.basename(dest) + ".", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_archive(iter_archive_members(paths), f, fmt, progress, cancel_event, store_compressed)
+        os.chmod(tmp, ARCHIVE_MODE)
+        os.replace(tmp, dest)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return dest
+
+
+# --- DRAG OUT ---
+TEXT_DRAG_EXTENSIONS = ('.txt', '.py', '.md', '.csv', '.json')
+
+
+class LazyDragContent(Gdk.ContentProvider):
+    # Advertises text/uri-list (and text/plain for a text file) without building either,
+    # plus whatever else Gdk.FileList serialises to, which includes the document portal
+    # formats sandboxed targets need. Nothing is resolved until the drop target asks for a
+    # format; uri-lists and text are then streamed to the target's pipe from a worker
+    # thread, and the other formats go through GDK's own FileList serializers.
+    __gtype_name__ = 'DropShelfLazyDragContent'
+
+    def __init__(self, resolve_paths, text_path=None, text_limit=1024 * 1024, archive=None, is_local=None):
+        super().__init__()
+        self.resolve_paths = resolve_paths
+        self.text_path = text_path
+        self.text_limit = text_limit
+        # archive(paths) -> path: when given, the paths are packed on the writer thread and
+        # the target receives that single file instead, unless is_local() says the drop is
+        # landing back on the shelf
+        self.archive = archive
+        self.is_local = is_local
+        self.archive_path = None
+        self.archive_lock = threading.Lock()
+        self.paths = None
+        self.file_list_formats = Gdk.ContentFormats.new_for_gtype(Gdk.FileList).union_serialize_mime_types()
+
+    def do_ref_formats(self):
+        builder = Gdk.ContentFormatsBuilder.new()
+        builder.add_mime_type("text/uri-list")
+        if self.text_path:
+            builder.add_mime_type("text/plain;charset=utf-8")
+            builder.add_mime_type("text/plain")
+        builder.add_formats(self.file_list_formats)
+        return builder.to_formats()
+
+    def do_write_mime_type_async(self, mime_type, stream, io_priority, cancellable, callback, user_data):
+        task = Gio.Task.new(self, cancellable, callback, user_data)
+        if mime_type == "text/uri-list":
+            self._resolve()
+            chunks = self._archive_uri_chunks() if self._packing() else self._uri_chunks(self.paths)
+        elif mime_type.startswith("text/plain") and self.text_path:
+            chunks = self._text_chunks(self.text_path)
+        elif self.file_list_formats.contain_mime_type(mime_type):
+            self._resolve()
+            if self._packing():
+                threading.Thread(target=self._archive_and_serialize,
+                                 args=(task, mime_type, stream, io_priority, cancellable), daemon=True).start()
+            else:
+                self._serialize_files(task, mime_type, stream, io_priority, cancellable, self.paths)
+            return
+        else:
+            task.return_error(GLib.Error.new_literal(Gio.io_error_quark(), f"unsupported format {mime_type}",
+                                                     Gio.IOErrorEnum.NOT_SUPPORTED))
+            return
+        threading.Thread(target=self._write, args=(task, stream, chunks, cancellable), daemon=True).start()
+
+    def do_write_mime_type_finish(self, result):
+        return result.propagate_boolean()
+
+    def _packing(self):
+        # A self-drop is discarded by the shelf, so it is never worth packing an archive for
+        return self.archive is not None and not (self.is_local and self.is_local())
+
+    def _resolve(self):
+        if self.paths is None:
+            # Resolved on the main loop, once, and only because a target asked
+            self.paths = self.resolve_paths()
+
+    @staticmethod
+    def _as_error(e):
+        return e if isinstance(e, GLib.Error) else GLib.Error.new_literal(
+            Gio.io_error_quark(), str(e), Gio.IOErrorEnum.FAILED)
+
+    def _write(self, task, stream, chunks, cancellable):
         try:
-            f = Gio.File.new_for_path(self.path)
-            info = f.query_info(Gio.FILE_ATTRIBUTE_STANDARD_CONTENT_TYPE, Gio.FileQueryInfoFlags.NONE, None)
-            content_type = info.get_content_type()
-            self.gicon = Gio.content_type_get_icon(content_type)
-        except:
-            self.gicon = Gio.ThemedIcon.new("text-x-generic")
+            for chunk in chunks:
+                stream.write_all(chunk, cancellable)
+            GLib.idle_add(self._finish, task, None)
+        except Exception as e:
+            GLib.idle_add(self._finish, task, self._as_error(e))
+
+    def _archive_and_serialize(self, task, mime_type, stream, io_priority, cancellable):
+        # Packs on this thread, then hands the single archive to GDK back on the main loop
+        try:
+            path = self._archived()
+        except Exception as e:
+            GLib.idle_add(self._finish, task, self._as_error(e))
+            return
+        GLib.idle_add(self._serialize_files, task, mime_type, stream, io_priority, cancellable, [path])
+
+    def _serialize_files(self, task, mime_type, stream, io_priority, cancellable, paths):
+        # The FileList is only built now that a target asked for one of its formats
+        files = Gdk.FileList.new_from_list([Gio.File.new_for_path(path) for path in paths])
+        Gdk.content_serialize_async(stream, mime_type, GObject.Value(Gdk.FileList, files), io_priority,
+                                    cancellable, self._on_serialized, task)
+        return False
 
+    def _on_serialized(self, stream, result, task):
+        try:
+            Gdk.content_serialize_finish(result)
+            task.return_boolean(True)
+        except GLib.Error as e:
+            task.return_error(e)
+
+    def _finish(self, task, error):
+        if error is None:
+            task.return_boolean(True)
+        else:
+            task.return_error(error)
+        return False
+
+    def _archive_uri_chunks(self):
+        # Runs on the writer thread; the target's read simply waits until the archive is done
+        yield from self._uri_chunks([self._archived()])
+
+    def _archived(self):
+        # Several formats may be requested at once; the archive is still built only once
+        with self.archive_lock:
+            if self.archive_path is None:
+                self.archive_path = self.archive(self.paths)
+            return self.archive_path
+
+    @staticmethod
+    def _uri_chunks(paths, batch=512):
+        for start in range(0, len(paths), batch):
+            yield "".join(GLib.filename_to_uri(path, None) + "\r\n" for path in paths[start:start + batch]).encode("utf-8")
+
+    def _text_chunks(self, path, chunk_size=64 * 1024):
+        remaining = self.text_limit
+        with open(path, "rb") as f:
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
 
 
+# --- STARTUP ---
+class StartupProfile:
+    # Milestones of one launch, in ms since main.py started executing. Enabled by
+    # --startup-profile, which prints them once the shelf is fully restored and quits.
+    def __init__(self):
+        self.marks = [("imports", (STARTUP_IMPORTED - STARTUP_T0) * 1000)]
+        self.items = 0
+
+    def mark(self, name):
+        self.marks.append((name, (time.perf_counter() - STARTUP_T0) * 1000))
+
+    def report(self):
+        for name, ms in self.marks:
+            print(f"[STARTUP] {name:<14} {ms:8.1f} ms", file=sys.stderr)
+        print(f"[STARTUP] {self.items} items restored", file=sys.stderr)
+        print(json.dumps({"marks_ms": dict(self.marks), "items": self.items}), flush=True)
 
 
 # --- MAIN WINDOW ---
@@ -59,6 +2062,9 @@ class DropShelfWindow(Adw.ApplicationWindow):
         self.ctrl_pressed = False
         self.locked = False
         self.search_query = ""
+        self.search_timeout_id = 0
+        self.content_index = None
+        self.content_matches = None
         self.icon_size = 56
         
         # LOGIC FLAGS
@@ -74,15 +2080,43 @@ class DropShelfWindow(Adw.ApplicationWindow):
         self.connect("close-request", self.on_close_request)
         
         # STORAGE
-        self.state_file = os.path.join(os.getcwd(), "state.json")
+        self.storage = open_storage(self.snapshot_state)
+        self.restore_id = 0
+        self.restored = False
+        self.restore_waiters = []
         self.cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "dropshelf")
         os.makedirs(self.cache_dir, exist_ok=True)
         
+        # THUMBNAILS
+        self.thumb_dir = os.path.join(self.cache_dir, "thumbnails")
+        self.thumbnails = ThumbnailEngine(self.icon_size, ThumbnailDiskCache(self.thumb_dir))
+        
         self.settings = {
             "download_images": True,
             "csv_mode": False,
-            "opacity": 1.0
+            "opacity": 1.0,
+            "texture_cache_mb": 32,
+            "download_max_mb": 200,
+            "download_timeout": 30,
+            "csv_columns": ["text"],
+            "csv_max_mb": 10,
+            "archive_drag": "off",
+            "archive_store_compressed": True
         }
+        self.blobs = BlobStore(self.cache_dir)
+        self.blob_gc_id = GLib.timeout_add_seconds(10, self.collect_blob_garbage)
+        self.downloads = DownloadManager(
+            os.path.join(self.cache_dir, ".incoming"),
+            lambda snapshot: GLib.idle_add(self.on_download_progress, snapshot),
+            lambda job, tmp_path, error: GLib.idle_add(
+                self.on_download_finished, job, self.store_download(job, tmp_path), error))
+        self.csv_collector = CsvCollector(self.cache_dir, self.add_file_path_to_store)
+        self.ingest_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest")
+        self.finished_files = []
+        self.finished_flush_id = 0
+        self.archive_cancel = threading.Event()
+        self.archive_progress_at = 0.0
+        self.texture_cache = TextureCache(self.settings["texture_cache_mb"] * 1024 * 1024)
         # LAYOUT
         self.toolbar_view = Adw.ToolbarView()
         self.set_content(self.toolbar_view)
@@ -103,8 +2137,16 @@ class DropShelfWindow(Adw.ApplicationWindow):
         self.search_bar = Gtk.SearchBar()
         self.search_entry = Gtk.SearchEntry()
         self.search_entry.set_placeholder_text("Type to filter...")
-        self.search_entry.connect("search-changed", self.on_search_changed)
-        self.search_bar.set_child(self.search_entry)
+        self.search_entry.connect("changed", self.on_search_changed)
+        self.search_entry.set_hexpand(True)
+        self.btn_content_search = Gtk.ToggleButton(icon_name="text-x-generic-symbolic")
+        self.btn_content_search.set_tooltip_text("Search Inside Text Files")
+        self.btn_content_search.add_css_class("flat")
+        self.btn_content_search.connect("toggled", self.on_content_search_toggled)
+        search_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        search_box.append(self.search_entry)
+        search_box.append(self.btn_content_search)
+        self.search_bar.set_child(search_box)
         self.search_bar.connect_entry(self.search_entry)
         self.toolbar_view.add_top_bar(self.search_bar)
         self.scrolled_window = Gtk.ScrolledWindow()
@@ -117,19 +2159,50 @@ class DropShelfWindow(Adw.ApplicationWindow):
         self.status_label.set_margin_top(8)
         self.status_label.set_margin_bottom(8)
         self.status_bar.append(self.status_label)
+        self.btn_cancel_downloads = Gtk.Button(icon_name="process-stop-symbolic")
+        self.btn_cancel_downloads.add_css_class("flat")
+        self.btn_cancel_downloads.set_tooltip_text("Cancel Downloads")
+        self.btn_cancel_downloads.set_visible(False)
+        self.btn_cancel_downloads.connect("clicked", lambda b: self.cancel_downloads())
+        self.status_bar.append(self.btn_cancel_downloads)
         self.toolbar_view.add_bottom_bar(self.status_bar)
         self.store = Gio.ListStore(item_type=FileItem)
+        self.index = ShelfIndex()
+        self.pending_batch = None
+        self.bound_rows = {}  # item -> list_item currently showing it
+        self.resolver = MetadataResolver(self.on_metadata_resolved)
+        self.watcher = ShelfWatcher(self.on_shelf_files_changed)
         self.filter = Gtk.CustomFilter.new(match_func=self.filter_func)
         self.filter_model = Gtk.FilterListModel(model=self.store, filter=self.filter)
         self.selection_model = Gtk.SingleSelection(model=self.filter_model)
         factory = Gtk.SignalListItemFactory()
         factory.connect("setup", self.on_factory_setup)
         factory.connect("bind", self.on_factory_bind)
+        factory.connect("unbind", self.on_factory_unbind)
         self.list_view = Gtk.ListView(model=self.selection_model, factory=factory)
         self.list_view.connect("activate", self.on_list_item_activated) 
         self.scrolled_window.set_child(self.list_view)
         self.setup_universal_drop_target()
-        self.load_state()
+        # State is loaded only after the first frame has been painted
+        self.map_handler_id = self.connect("map", self.on_first_map)
+        self.first_paint_id = 0
+
+    def on_first_map(self, widget):
+        self.disconnect(self.map_handler_id)
+        self.map_handler_id = 0
+        clock = self.get_frame_clock()
+        self.first_paint_id = clock.connect("after-paint", self.on_first_paint)
+
+    def on_first_paint(self, clock):
+        clock.disconnect(self.first_paint_id)
+        self.first_paint_id = 0
+        self.mark_startup("first_frame")
+        GLib.idle_add(self.load_state)
+
+    def mark_startup(self, name):
+        if self.app.startup_profile:
+            self.app.startup_profile.mark(name)
+
     # --- SEARCH ---
     def on_search_toggled(self, btn):
         if btn.get_active():
@@ -138,12 +2211,69 @@ class DropShelfWindow(Adw.ApplicationWindow):
         else:
             self.search_bar.set_search_mode(False)
     def on_search_changed(self, entry):
-        self.search_query = entry.get_text().lower()
-        self.filter.changed(Gtk.FilterChange.DIFFERENT)
+        # Debounce: a burst of keystrokes refilters once
+        if self.search_timeout_id:
+            GLib.source_remove(self.search_timeout_id)
+        self.search_timeout_id = GLib.timeout_add(SEARCH_DEBOUNCE_MS, self.apply_search)
+    def apply_search(self):
+        self.search_timeout_id = 0
+        query = self.search_entry.get_text().lower()
+        old = self.search_query
+        if query == old:
+            return False
+        self.search_query = query
+        old_matches = self.content_matches
+        self.update_content_matches()
+        # Substring matching: a query containing the old one can only match fewer items,
+        # so GTK only needs to recheck what is visible (and vice versa). That no longer holds
+        # when content matching switches on or off, e.g. as the query crosses 3 characters.
+        if (old_matches is None) != (self.content_matches is None):
+            change = Gtk.FilterChange.DIFFERENT
+        elif old in query:
+            change = Gtk.FilterChange.MORE_STRICT
+        elif query in old:
+            change = Gtk.FilterChange.LESS_STRICT
+        else:
+            change = Gtk.FilterChange.DIFFERENT
+        # On big shelves refilter in idle chunks instead of one long stall
+        self.filter_model.set_incremental(self.store.get_n_items() > INCREMENTAL_FILTER_THRESHOLD)
+        self.filter.changed(change)
+        return False
     def filter_func(self, item, user_data=None):
-        if not self.search_query:
+        query = self.search_query
+        if not query or query in item.search_key:
             return True
-        return self.search_query in item.filename.lower()
+        matches = self.content_matches
+        return matches is not None and item.path in matches
+    def on_content_search_toggled(self, btn):
+        active = btn.get_active()
+        if self.settings.get("content_search", False) != active:
+            self.update_setting("content_search", active)
+        if active:
+            self.ensure_content_index()
+            # Picks up files changed while the mode was off; unchanged ones cost one stat
+            for i in range(self.store.get_n_items()):
+                self.content_index.update(self.store.get_item(i).path)
+        self.update_content_matches()
+        self.filter.changed(Gtk.FilterChange.MORE_STRICT if not active else Gtk.FilterChange.LESS_STRICT)
+    def ensure_content_index(self):
+        if self.content_index:
+            return
+        self.content_index = ContentIndex(self.on_content_index_updated)
+    def update_content_matches(self):
+        if self.content_index and self.btn_content_search.get_active() and self.search_query:
+            self.content_matches = self.content_index.search(self.search_query, self.on_content_verified)
+        else:
+            self.content_matches = None
+    def on_content_verified(self, matches):
+        # The confirmed matches are a subset of the candidates shown so far
+        if self.content_matches is not None:
+            self.content_matches = matches
+            self.filter.changed(Gtk.FilterChange.MORE_STRICT)
+    def on_content_index_updated(self):
+        if self.content_matches is not None:
+            self.update_content_matches()
+            self.filter.changed(Gtk.FilterChange.DIFFERENT)
     # --- FACTORY & UI LOGIC ---
     def on_factory_setup(self, factory, list_item):
         box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12)
@@ -175,6 +2305,8 @@ class DropShelfWindow(Adw.ApplicationWindow):
         pin_btn.add_css_class("flat")
         pin_btn.set_tooltip_text("Pin Item")
         pin_btn.set_visible(False) 
+        # Handlers are connected once per row widget and look up the bound item when fired
+        pin_btn.connect("clicked", self.on_pin_clicked, list_item)
         
         del_btn = Gtk.Button(icon_name="user-trash-symbolic")
         del_btn.add_css_class("flat")
@@ -197,6 +2329,9 @@ class DropShelfWindow(Adw.ApplicationWindow):
         drag_source.connect("drag-end", self.on_drag_end, list_item)
         box.add_controller(drag_source)
         list_item.widgets = (img_display, icon_wrapper, label, view_btn, pin_btn)
+        list_item.thumb_request = None
+        list_item.has_texture = False
+    @traced("row.bind")
     def on_factory_bind(self, factory, list_item):
         img_display, icon_wrapper, label, view_btn, pin_btn = list_item.widgets
         item = list_item.get_item()
@@ -209,64 +2344,76 @@ class DropShelfWindow(Adw.ApplicationWindow):
         else:
             pin_btn.remove_css_class("red-icon")
             pin_btn.set_visible(False) 
-            
-        try:
-            pin_btn.disconnect_by_func(self.toggle_pin)
-        except:
-            pass
-        pin_btn.connect("clicked", self.toggle_pin, item, pin_btn)
-        # --- IMAGE THUMBNAIL LOGIC ---
-        is_potential_image = any(item.filename.lower().endswith(x) for x in ['.jpg','.png','.jpeg','.webp'])
-        loaded_as_image = False
-        target_size = self.icon_size
+        self.bound_rows[item] = list_item
+        if not item.resolved:
+            self.resolver.prioritize(item)
         
-        if is_potential_image and os.path.exists(item.path):
-            try:
-                # 1. Load original image
-                pb = GdkPixbuf.Pixbuf.new_from_file(item.path)
-                w, h = pb.get_width(), pb.get_height()
-                
-                # 2. Calculate scale to "Cover" the square
-                scale = max(target_size / w, target_size / h)
-                
-                # 3. Calculate new dimensions, forcing AT LEAST target_size
-                new_w = int(w * scale)
-                new_h = int(h * scale)
-                if new_w < target_size: new_w = target_size
-                if new_h < target_size: new_h = target_size
-                
-                # 4. Scale the image
-                pb_scaled = pb.scale_simple(new_w, new_h, GdkPixbuf.InterpType.BILINEAR)
-                
-                # 5. Center Crop (safely)
-                real_w = pb_scaled.get_width()
-                real_h = pb_scaled.get_height()
-                
-                x_off = (real_w - target_size) // 2
-                y_off = (real_h - target_size) // 2
-                
-                if x_off < 0: x_off = 0
-                if y_off < 0: y_off = 0
-                if x_off + target_size > real_w: x_off = real_w - target_size
-                if y_off + target_size > real_h: y_off = real_h - target_size
-                
-                cropped_pb = pb_scaled.new_subpixbuf(x_off, y_off, target_size, target_size)
-                
-                # 6. Set Texture
-                texture = Gdk.Texture.new_for_pixbuf(cropped_pb)
-                img_display.set_from_paintable(texture)
-                
-                # Apply Styles
-                icon_wrapper.add_css_class("rounded-image")
-                icon_wrapper.set_overflow(Gtk.Overflow.HIDDEN) 
-                loaded_as_image = True
-            except: 
-                loaded_as_image = False
-        
-        if not loaded_as_image:
-            img_display.set_from_gicon(item.gicon)
-            icon_wrapper.remove_css_class("rounded-image")
-            icon_wrapper.set_overflow(Gtk.Overflow.VISIBLE)
+        # --- IMAGE THUMBNAIL LOGIC ---
+        self.cancel_thumbnail(list_item)
+        list_item.has_texture = False
+        if not is_thumbnailable(item.filename):
+            self.show_icon(list_item, item)
+            return
+        # No stat here: on a slow mount that would block the main loop for every bound row
+        texture = self.texture_cache.get(item.path)
+        if texture:
+            self.show_texture(list_item, texture)
+            if not self.watcher.covers(item.path):
+                # Nothing reports edits to this file, so a worker checks its stamp instead
+                list_item.thumb_request = self.thumbnails.request(
+                    item.path, lambda path, pixbuf, stamp: self.on_thumbnail_ready(list_item, item, path, pixbuf, stamp),
+                    self.texture_cache.stamp(item.path))
+            return
+        # Show the placeholder icon now, swap in the texture when the worker is done
+        self.show_icon(list_item, item)
+        list_item.thumb_request = self.thumbnails.request(
+            item.path, lambda path, pixbuf, stamp: self.on_thumbnail_ready(list_item, item, path, pixbuf, stamp))
+    def on_factory_unbind(self, factory, list_item):
+        self.cancel_thumbnail(list_item)
+        img_display, icon_wrapper, label, view_btn, pin_btn = list_item.widgets
+        # Let go of the texture so only TextureCache decides how long it stays in memory
+        if list_item.has_texture:
+            img_display.clear()
+            list_item.has_texture = False
+        # A row recycled while hovered never gets its leave event
+        view_btn.set_visible(False)
+        item = list_item.get_item()
+        if item is not None and self.bound_rows.get(item) is list_item:
+            del self.bound_rows[item]
+    def on_metadata_resolved(self, resolved, missing):
+        for item in resolved:
+            list_item = self.bound_rows.get(item)
+            if list_item is not None and not list_item.has_texture:
+                self.show_icon(list_item, item)
+        if missing:
+            with self.batch():
+                for item in missing:
+                    self.remove_item_from_store(item)
+    def cancel_thumbnail(self, list_item):
+        req = getattr(list_item, "thumb_request", None)
+        if req:
+            req.cancel()
+            list_item.thumb_request = None
+    def show_icon(self, list_item, item):
+        img_display, icon_wrapper = list_item.widgets[:2]
+        img_display.set_from_gicon(item.gicon)
+        icon_wrapper.remove_css_class("rounded-image")
+        icon_wrapper.set_overflow(Gtk.Overflow.VISIBLE)
+    def on_thumbnail_ready(self, list_item, item, path, pixbuf, stamp):
+        list_item.thumb_request = None
+        if pixbuf is None:
+            return
+        texture = Gdk.Texture.new_for_pixbuf(pixbuf)
+        self.texture_cache.put(path, texture, stamp)
+        # Row was recycled for another item while we were decoding
+        if list_item.get_item() is item:
+            self.show_texture(list_item, texture)
+    def show_texture(self, list_item, texture):
+        img_display, icon_wrapper = list_item.widgets[:2]
+        img_display.set_from_paintable(texture)
+        list_item.has_texture = True
+        icon_wrapper.add_css_class("rounded-image")
+        icon_wrapper.set_overflow(Gtk.Overflow.HIDDEN)
     def on_row_enter(self, controller, x, y, list_item):
         if self.locked:
             return
@@ -277,39 +2424,112 @@ class DropShelfWindow(Adw.ApplicationWindow):
         item = list_item.get_item()
         img, wrapper, lbl, view_btn, pin_btn = list_item.widgets
         view_btn.set_visible(False)
-        if not item.pinned:
+        if item is None or not item.pinned:
             pin_btn.set_visible(False)
     def on_view_clicked(self, btn, list_item):
         self.preview_selected_item_obj(list_item.get_item())
+    def on_pin_clicked(self, btn, list_item):
+        item = list_item.get_item()
+        if item is not None:
+            self.toggle_pin(btn, item, btn)
     # --- DRAG LOGIC ---
+    @traced("drag.prepare")
     def on_drag_prepare(self, source, x, y, list_item):
         self.is_dragging = True
         self.is_self_drop = False
         item = list_item.get_item()
-        # print(f"[DRAG] Path: {item.path}")
-        # print(f"[DRAG] Exists: {os.path.exists(item.path)}")
-        
-        item = list_item.get_item()
+        # Nothing is read or built here; the provider pulls paths and text on demand
         if self.ctrl_pressed:
-            gfile = Gio.File.new_for_path(item.path)
-            content_files = Gdk.ContentProvider.new_for_value(Gdk.FileList.new_from_list([gfile]))
-        else:
-            n = self.filter_model.get_n_items()
-            file_list = []
-            for i in range(n):
-                fi = self.filter_model.get_item(i)
-                file_list.append(Gio.File.new_for_path(fi.path))
-            content_files = Gdk.ContentProvider.new_for_value(Gdk.FileList.new_from_list(file_list))
-        try:
-            is_text = any(item.filename.endswith(x) for x in ['.txt', '.py', '.md', '.csv', '.json'])
-            if is_text and not self.ctrl_pressed:
-                with open(item.path, 'r') as f:
-                    text_content = f.read(1024 * 1024)
-                content_text = Gdk.ContentProvider.new_for_bytes("text/plain", GLib.Bytes.new(text_content.encode('utf-8')))
-                return Gdk.ContentProvider.new_union([content_files, content_text])
-        except:
-            pass
-        return content_files
+            return LazyDragContent(lambda: [item.path])
+        if self.settings.get("archive_drag", "off") in ARCHIVE_FORMATS:
+            return LazyDragContent(self.filtered_paths, archive=self.make_drag_archive, is_local=self.is_local_drop)
+        text_path = item.path if item.filename.endswith(TEXT_DRAG_EXTENSIONS) else None
+        return LazyDragContent(self.filtered_paths, text_path)
+    def filtered_paths(self):
+        return [self.filter_model.get_item(i).path for i in range(self.filter_model.get_n_items())]
+    def is_local_drop(self):
+        # Our drop targets hold the drop while its data is read, so this is our own drag landing here
+        return self.is_dragging and any(t.get_current_drop() is not None for t in self.drop_targets)
+    # --- ARCHIVES ---
+    def make_drag_archive(self, paths):
+        # Called on the drag writer thread
+        fmt = self.settings.get("archive_drag", "zip")
+        archive_dir = os.path.join(self.cache_dir, "archives")
+        self.prune_archives(archive_dir)
+        import tempfile
+        os.makedirs(archive_dir, exist_ok=True)
+        # Reserves a unique name; two drags in the same second must not share an archive
+        fd, dest = tempfile.mkstemp(dir=archive_dir, prefix="DropShelf-", suffix=ARCHIVE_FORMATS[fmt])
+        os.close(fd)
+        try:
+            return self.run_archive(paths, dest, fmt)
+        except BaseException:
+            try:
+                os.remove(dest)
+            except OSError:
+                pass
+            raise
+    def prune_archives(self, archive_dir, max_age=3600):
+        # Drag archives only need to outlive the drop that asked for them
+        try:
+            entries = list(os.scandir(archive_dir))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if time.time() - entry.stat().st_mtime > max_age:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+    def run_archive(self, paths, dest, fmt):
+        GLib.idle_add(self.on_archive_progress, 0, 0)
+        try:
+            build_archive(paths, dest, fmt, self.report_archive_progress, self.archive_cancel,
+                          self.settings.get("archive_store_compressed", True))
+        except ArchiveCancelled:
+            GLib.idle_add(self.show_temp_status, "Archive cancelled")
+            raise
+        except Exception as e:
+            # Also reached from an export, whose future nobody reads
+            print(f"[ARCHIVE] Failed to write {dest}: {e}", file=sys.stderr)
+            GLib.idle_add(self.show_temp_status, "Could not create archive")
+            raise
+        GLib.idle_add(self.show_temp_status, f"Archive ready: {os.path.basename(dest)}")
+        return dest
+    def report_archive_progress(self, done, total):
+        # Worker thread: at most ten status updates a second
+        now = time.monotonic()
+        if now - self.archive_progress_at >= 0.1:
+            self.archive_progress_at = now
+            GLib.idle_add(self.on_archive_progress, done, total)
+    def on_archive_progress(self, done, total):
+        if not self.locked:
+            label = f"Packing archive... {format_size(done)}"
+            if total:
+                label += f" / {format_size(total)}"
+            self.status_label.set_label(label)
+        return False
+    def on_export_archive_clicked(self, btn):
+        paths = self.filtered_paths()
+        if not paths:
+            self.show_temp_status("Nothing to export")
+            return
+        fmt = self.settings.get("archive_drag", "off")
+        if fmt not in ARCHIVE_FORMATS:
+            fmt = "zip"
+        dialog = Gtk.FileDialog(title="Export as Archive", initial_name=f"DropShelf{ARCHIVE_FORMATS[fmt]}")
+        dialog.save(self, None, self.on_export_archive_chosen, paths)
+    def on_export_archive_chosen(self, dialog, result, paths):
+        try:
+            gfile = dialog.save_finish(result)
+        except GLib.Error:
+            return
+        dest = gfile.get_path() if gfile else None
+        if not dest:
+            return
+        fmt = "tar.gz" if dest.endswith((".tar.gz", ".tgz")) else "zip"
+        # Written straight to the chosen file by a worker
+        self.ingest_executor.submit(self.run_archive, paths, dest, fmt)
     def on_drag_end(self, source, drag, delete_data, list_item):
         self.is_dragging = False
         
@@ -334,14 +2554,85 @@ class DropShelfWindow(Adw.ApplicationWindow):
                 fi = self.filter_model.get_item(i)
                 if not fi.pinned:
                     items_to_remove.append(fi)
-            for item in items_to_remove:
-                self.remove_item_from_store(item)
-        self.save_state()
+            with self.batch():
+                for item in items_to_remove:
+                    self.remove_item_from_store(item)
+    @contextmanager
+    def batch(self):
+        # Nested calls join the outermost batch; the store changes and state is saved once
+        if self.pending_batch is not None:
+            yield self.pending_batch
+            return
+        batch = self.pending_batch = ShelfBatch(self.store, self.index)
+        try:
+            yield batch
+        finally:
+            self.pending_batch = None
+            if batch.commit():
+                self.on_items_committed(batch.added, list(batch.removed))
+                self.storage.items_changed(batch.added, list(batch.removed))
+    def on_items_committed(self, added, removed):
+        # Keeps everything that shadows shelf membership in step with the store
+        self.resolver.enqueue(added)
+        for item in added:
+            self.watcher.watch(item.path)
+        for item in removed:
+            self.watcher.unwatch(item.path)
+        if self.content_index:
+            for item in added:
+                self.content_index.update(item.path)
+            for item in removed:
+                self.content_index.discard(item.path)
+    def on_shelf_files_changed(self, changed, deleted, renames):
+        touched = set()
+        with self.batch():
+            for old_path, new_path in renames.items():
+                item = self.index.get(old_path)
+                if item is None:
+                    continue
+                if os.path.exists(old_path):
+                    # Renamed away and recreated (e.g. a CSV rollover): the shelved path still lives
+                    item.resolved = False
+                    touched.add(item)
+                    continue
+                if new_path in self.index:
+                    # Renamed onto something already shelved: keep that one
+                    self.remove_item_from_store(item)
+                    continue
+                self.watcher.unwatch(old_path)
+                self.index.rename(item, new_path)
+                self.watcher.watch(new_path)
+                self.texture_cache.invalidate(old_path)
+                if self.content_index:
+                    self.content_index.discard(old_path)
+                self.storage.item_renamed(old_path, item)
+                touched.add(item)
+            for path in deleted:
+                item = self.index.get(path)
+                # Editors that save by delete + recreate show up as a delete; trust the disk
+                if item is not None and not os.path.exists(path):
+                    self.texture_cache.invalidate(path)
+                    self.remove_item_from_store(item)
+            for path in changed:
+                item = self.index.get(path)
+                if item is not None:
+                    item.resolved = False
+                    touched.add(item)
+        for item in touched:
+            self.texture_cache.invalidate(item.path)
+            if self.content_index:
+                self.content_index.update(item.path)
+        touched = [item for item in touched if item in self.index.slots]
+        if not touched:
+            return
+        self.resolver.enqueue(touched)
+        # One items-changed over the affected span rebinds every visible row in it
+        positions = [self.index.position(item) for item in touched]
+        first, last = min(positions), max(positions)
+        self.store.items_changed(first, last - first + 1, last - first + 1)
     def remove_item_from_store(self, item):
-        for i in range(self.store.get_n_items()):
-            if self.store.get_item(i) == item:
-                self.store.remove(i)
-                break
+        with self.batch() as batch:
+            batch.remove(item)
     # --- CORE ---
     def get_selected_item(self):
         return self.selection_model.get_selected_item()
@@ -354,7 +2645,7 @@ class DropShelfWindow(Adw.ApplicationWindow):
                 widget_btn.set_visible(True)
             else:
                 widget_btn.remove_css_class("red-icon")
-        self.save_state()
+        self.storage.item_updated(item)
         
     def remove_item_by_index(self, index):
         if self.locked:
@@ -362,14 +2653,15 @@ class DropShelfWindow(Adw.ApplicationWindow):
         item = self.filter_model.get_item(index)
         if not item:
             return
+        self.texture_cache.invalidate(item.path)
         if item.path.startswith(self.cache_dir):
             try:
                 if os.path.exists(item.path):
                     os.remove(item.path)
+                    self.schedule_blob_gc()
             except:
                 pass
         self.remove_item_from_store(item)
-        self.save_state()
         
     def on_delete_clicked(self, btn, list_item):
         if self.locked:
@@ -388,7 +2680,9 @@ class DropShelfWindow(Adw.ApplicationWindow):
         target_text = Gtk.DropTarget.new(str, Gdk.DragAction.COPY)
         target_text.connect("drop", self.on_text_drop)
         self.toolbar_view.add_controller(target_text)
+        self.drop_targets = (target_files, target_text)
         
+    @traced("drop.files")
     def on_file_drop(self, target, value, x, y):
 
         if self.locked:
@@ -405,13 +2699,14 @@ class DropShelfWindow(Adw.ApplicationWindow):
         
         # value is Gdk.FileList
         files = value.get_files()
-        for gfile in files:
-            path = gfile.get_path()
-            if path and os.path.exists(path):
-                self.add_file_path_to_store(path)
-        self.save_state()
+        with self.batch():
+            for gfile in files:
+                path = gfile.get_path()
+                if path and os.path.exists(path):
+                    self.add_file_path_to_store(path)
         return True
         
+    @traced("drop.text")
     def on_text_drop(self, target, value, x, y):
         if self.locked:
             return False
@@ -425,10 +2720,16 @@ class DropShelfWindow(Adw.ApplicationWindow):
             return False
             
         uris = value.splitlines()
-        changes_made = False
         
+        with self.batch():
+            self.handle_text_uris(uris)
+        return True
+        
+    def handle_text_uris(self, uris):
         for uri in uris:
-            uri = uri.strip().replace('\x00', '')
+            uri = uri.strip()
+            if '\x00' in uri:
+                uri = uri.replace('\x00', '')
             if not uri:
                 continue
             
@@ -448,7 +2749,7 @@ class DropShelfWindow(Adw.ApplicationWindow):
                     continue
                 
                 if self.settings.get("csv_mode", False):
-                    self.append_to_csv(uri)
+                    self.append_to_csv(uri, "link")
                 else:
                     self.save_text_content(uri, "saved_link.txt")
                 continue
@@ -466,92 +2767,124 @@ class DropShelfWindow(Adw.ApplicationWindow):
             
             if path and os.path.exists(path):
                 self.add_file_path_to_store(path)
-                changes_made = True
             else:
                 # Fallback: Treat as plain text
                 if self.settings.get("csv_mode", False):
                     self.append_to_csv(uri)
                 else:
                     self.save_text_content(uri, "dragged_text.txt")
-
-        if changes_made:
-            self.save_state()
-        return True
         
-    def append_to_csv(self, text):
-        csv_path = os.path.join(self.cache_dir, "collected.csv")
-        try:
-            with open(csv_path, "a") as f:
-                f.write(f'"{text.replace(chr(10)," ")}"\n')
-            self.add_file_path_to_store(csv_path)
-            self.save_state()
-            self.show_temp_status("Added to CSV")
-        except:
-            pass
+    def append_to_csv(self, text, source="text"):
+        self.csv_collector.add(text, source)
+        self.show_temp_status("Added to CSV")
 
     def save_text_content(self, content, default_name):
-        save_path = self.get_unique_path(default_name)
         try:
-            with open(save_path, "w") as f:
-                f.write(content)
+            save_path = self.blobs.write(default_name, [content.encode("utf-8")])
             self.add_file_path_to_store(save_path)
-            self.save_state()
         except:
             pass
 
 
     def add_file_path_to_store(self, path):
-        for i in range(self.store.get_n_items()):
-            if self.store.get_item(i).path == path:
-                return 
-        self.store.append(FileItem(path))
+        with self.batch() as batch:
+            batch.add(path)
     def save_base64_image(self, uri):
+        # Decoding and writing happen on a worker; big screenshots never stall the drop
         try:
-            header, encoded = uri.split(",", 1)
-            ext = ".png"
-            if "jpeg" in header:
-                ext = ".jpg"
-            save_path = self.get_unique_path("dropped_image" + ext)
-            with open(save_path, "wb") as f:
-                f.write(base64.b64decode(encoded))
-            self.add_file_path_to_store(save_path)
-            self.save_state()
-        except:
-            pass
+            mime, is_base64, start = parse_data_uri(uri)
+        except ValueError:
+            return
+        filename = "dropped_image" + data_uri_extension(mime)
+        
+        def ingest():
+            try:
+                save_path = self.blobs.write(filename, iter_data_uri_payload(uri, start, is_base64))
+            except (OSError, ValueError):
+                GLib.idle_add(self.show_temp_status, "Could not save dropped image")
+                return
+            GLib.idle_add(self.on_file_ready, save_path)
+        
+        self.ingest_executor.submit(ingest)
 
     def download_image(self, url):
         try:
             parsed = urlparse(url)
             filename = os.path.basename(parsed.path) or "downloaded_image.jpg"
             filename = unquote(filename)
-            save_path = self.get_unique_path(filename)
-            self.status_label.set_label("Downloading...")
-            req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-            
-            def dl_worker():
-                try:
-                    with urllib.request.urlopen(req) as r, open(save_path, 'wb') as f:
-                        f.write(r.read())
-                    GLib.idle_add(self.on_download_success, save_path)
-                except:
-                    GLib.idle_add(self.update_status_ui)
-                    
-            threading.Thread(target=dl_worker, daemon=True).start()
         except:
-            pass
+            return
+        max_bytes = int(self.settings.get("download_max_mb", 200) * 1024 * 1024)
+        timeout = self.settings.get("download_timeout", 30)
+        if self.downloads.submit(url, filename, max_bytes, timeout):
+            self.btn_cancel_downloads.set_visible(True)
+            self.status_label.set_label("Downloading...")
 
-    def get_unique_path(self, filename):
-        save_path = os.path.join(self.cache_dir, filename)
-        base, ext = os.path.splitext(save_path)
-        c = 1
-        while os.path.exists(save_path):
-            save_path = f"{base}_{c}{ext}"
-            c += 1
-        return save_path
-    def on_download_success(self, save_path):
-        self.add_file_path_to_store(save_path)
-        self.save_state()
-        self.show_temp_status("Downloaded!")
+    def on_download_progress(self, snapshot):
+        if not self.downloads.busy():
+            self.btn_cancel_downloads.set_visible(False)
+            if self.locked:
+                return False
+            ok = snapshot["finished"] - snapshot["failed"]
+            if snapshot["failed"]:
+                self.show_temp_status(f"Downloaded {ok}, {snapshot['failed']} failed")
+            elif ok:
+                self.show_temp_status("Downloaded!" if ok == 1 else f"Downloaded {ok} files")
+            return False
+        if self.locked:
+            return False
+        label = f"Downloading {snapshot['finished']}/{snapshot['jobs']}... {format_size(snapshot['bytes_done'])}"
+        if snapshot["bytes_total"] > snapshot["bytes_done"]:
+            label += f" / {format_size(snapshot['bytes_total'])}"
+        self.status_label.set_label(label)
+        return False
+
+    def store_download(self, job, tmp_path):
+        # Runs on the download worker: hashing and linking stay off the main loop
+        if not tmp_path:
+            return None
+        try:
+            return self.blobs.ingest_file(tmp_path, job.filename)
+        except Exception as e:
+            # Not just OSError: a hostile name (e.g. one with a NUL) raises ValueError
+            print(f"[DOWNLOAD] Failed to store {job.url}: {e}", file=sys.stderr)
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+
+    def on_download_finished(self, job, save_path, error):
+        if save_path:
+            self.on_file_ready(save_path)
+        return False
+
+    def on_file_ready(self, path):
+        # Files finished by workers arriving close together land in the store as one batch
+        self.finished_files.append(path)
+        if not self.finished_flush_id:
+            self.finished_flush_id = GLib.timeout_add(250, self.flush_finished_files)
+        return False
+
+    def flush_finished_files(self):
+        self.finished_flush_id = 0
+        paths, self.finished_files = self.finished_files, []
+        with self.batch():
+            for path in paths:
+                self.add_file_path_to_store(path)
+        return False
+
+    def cancel_downloads(self):
+        self.downloads.cancel_all()
+
+    def collect_blob_garbage(self):
+        # Drops blobs no longer linked from any cached file, on a thread
+        self.blob_gc_id = 0
+        threading.Thread(target=self.blobs.collect_garbage, daemon=True).start()
+        return False
+    def schedule_blob_gc(self):
+        if not self.blob_gc_id:
+            self.blob_gc_id = GLib.timeout_add_seconds(5, self.collect_blob_garbage)
     def show_temp_status(self, msg):
         self.status_label.set_label(msg)
         GLib.timeout_add(2000, lambda: self.update_status_ui() or False)
@@ -591,8 +2924,9 @@ class DropShelfWindow(Adw.ApplicationWindow):
         if is_del and (state & Gdk.ModifierType.SHIFT_MASK):
             if not self.locked:
                 n = self.filter_model.get_n_items()
-                for i in range(n-1, -1, -1):
-                    self.remove_item_by_index(i)
+                with self.batch():
+                    for i in range(n):
+                        self.remove_item_by_index(i)
             return True
         if keyval in [Gdk.KEY_Control_L, Gdk.KEY_Control_R]:
             self.ctrl_pressed = True
@@ -630,6 +2964,18 @@ class DropShelfWindow(Adw.ApplicationWindow):
         self.set_visible(False)
         return True
 
+    def shutdown(self):
+        self.archive_cancel.set()
+        self.csv_collector.flush()
+        self.downloads.shutdown()
+        self.ingest_executor.shutdown(wait=True, cancel_futures=True)
+        self.resolver.cancel()
+        self.thumbnails.shutdown()
+        if self.restore_id:
+            GLib.source_remove(self.restore_id)
+            self.restore_id = 0
+        self.storage.flush()
+
     def setup_menu_popover(self):
         popover = Gtk.Popover()
         menu_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=4)
@@ -653,6 +2999,12 @@ class DropShelfWindow(Adw.ApplicationWindow):
         btn_prefs.connect("clicked", self.on_prefs_clicked)
         btn_prefs.connect("clicked", lambda x: popover.popdown()) 
         menu_box.append(btn_prefs)
+        btn_export = Gtk.Button(label="Export as Archive...")
+        btn_export.add_css_class("flat")
+        btn_export.set_halign(Gtk.Align.FILL)
+        btn_export.connect("clicked", self.on_export_archive_clicked)
+        btn_export.connect("clicked", lambda x: popover.popdown())
+        menu_box.append(btn_export)
         btn_shortcuts = Gtk.Button(label="Shortcuts")
         btn_shortcuts.add_css_class("flat")
         btn_shortcuts.set_halign(Gtk.Align.FILL)
@@ -677,7 +3029,7 @@ class DropShelfWindow(Adw.ApplicationWindow):
         val = scale.get_value()
         self.set_opacity(val)
         self.settings["opacity"] = val
-        self.save_state()
+        self.save_settings()
     def show_about_window(self, btn):
         display = Gdk.Display.get_default()
         theme = Gtk.IconTheme.get_for_display(display)
@@ -696,34 +3048,85 @@ class DropShelfWindow(Adw.ApplicationWindow):
         about.add_link("GitHub", "https://github.com/MChandrahas/DropShelf")
         about.set_copyright("© 2024 Chandrahas")
         about.present()
+    @traced("state.load")
     def load_state(self):
-        if not os.path.exists(self.state_file):
-            return
         try:
-            with open(self.state_file, 'r') as f:
-                data = json.load(f)
-            items = data.get("items", [])
-            for item_data in items:
-                path = item_data.get('path')
-                pinned = item_data.get('pinned', False)
+            settings, pages = self.storage.load()
+        except (OSError, ValueError):
+            settings, pages = None, iter(())
+        if settings:
+            self.settings = settings
+        self.set_opacity(self.settings.get("opacity", 1.0))
+        self.texture_cache.set_budget(self.settings.get("texture_cache_mb", 32) * 1024 * 1024)
+        self.btn_content_search.set_active(self.settings.get("content_search", False))
+        self.csv_collector.columns = tuple(self.settings.get("csv_columns", ["text"]))
+        self.csv_collector.set_max_bytes(int(self.settings.get("csv_max_mb", 10) * 1024 * 1024))
+        # Items go into the store a page at a time between frames
+        self.pending_pages = pages
+        self.restore_id = GLib.idle_add(self.restore_next_page)
+        self.mark_startup("state_loaded")
+        return False
+
+    @traced("state.restore_page")
+    def restore_next_page(self):
+        page = next(self.pending_pages, None)
+        if page is None:
+            self.finish_restore()
+            return False
+        batch = ShelfBatch(self.store, self.index)
+        for path, pinned in page:
+            # Existence is checked by the resolver, off the startup path
+            batch.add(path, pinned)
+        batch.commit()
+        self.on_items_committed(batch.added, [])
+        return True
+
+    def finish_restore(self):
+        self.restore_id = 0
+        self.restored = True
+        waiters, self.restore_waiters = self.restore_waiters, []
+        for callback in waiters:
+            callback()
+        self.app.on_restored(self)
+
+    def run_when_restored(self, callback):
+        # Remote commands must see the whole shelf, so they wait for the paged restore
+        if self.restored:
+            callback()
+        else:
+            self.restore_waiters.append(callback)
+
+    # --- REMOTE COMMANDS ---
+    def add_paths(self, paths):
+        # One batch however many paths: one splice, one save, one resolver pass
+        missing = []
+        with self.batch() as batch:
+            for path in paths:
                 if path and os.path.exists(path):
-                    self.store.append(FileItem(path, pinned))
-            self.settings = data.get("settings", self.settings)
-            self.set_opacity(self.settings.get("opacity", 1.0))
-        except:
-            pass
+                    batch.add(path)
+                else:
+                    missing.append(path)
+        return missing
+
+    def list_items(self):
+        return [self.store.get_item(i) for i in range(self.store.get_n_items())]
 
-    def save_state(self):
-        items_data = []
+    def clear_unpinned(self):
+        with self.batch() as batch:
+            for item in self.list_items():
+                if not item.pinned:
+                    batch.remove(item)
+
+    def save_settings(self):
+        self.storage.settings_changed(dict(self.settings))
+
+    @traced("state.snapshot")
+    def snapshot_state(self):
+        items = []
         for i in range(self.store.get_n_items()):
             item = self.store.get_item(i)
-            items_data.append({"path": item.path, "filename": item.filename, "pinned": item.pinned})
-        data = {"items": items_data, "settings": self.settings}
-        try:
-            with open(self.state_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        except:
-            pass
+            items.append((item.path, item.filename, item.pinned))
+        return items, dict(self.settings)
 
     def on_prefs_clicked(self, btn):
         prefs_window = Adw.PreferencesWindow(transient_for=self)
@@ -745,12 +3148,36 @@ class DropShelfWindow(Adw.ApplicationWindow):
         row_csv.connect("notify::active", lambda r,p: self.update_setting("csv_mode", r.get_active()))
         grp.add(row_csv)
         
+        for column, title in (("timestamp", "Add timestamp column"), ("source", "Add source column")):
+            row_col = Adw.SwitchRow(title=title)
+            row_col.set_subtitle(f"Record the {column} of each collected row")
+            row_col.set_active(column in self.settings.get("csv_columns", ["text"]))
+            row_col.connect("notify::active", lambda r, p, c=column: self.set_csv_column(c, r.get_active()))
+            row_csv.bind_property("active", row_col, "sensitive", GObject.BindingFlags.SYNC_CREATE)
+            grp.add(row_col)
+        
         row_dl = Adw.SwitchRow(title="<b>Download images</b>")
         row_dl.set_subtitle("Automatically save dropped image URLs to cache.")
         row_dl.set_active(self.settings.get("download_images", True))
         row_dl.connect("notify::active", lambda r,p: self.update_setting("download_images", r.get_active()))
         grp.add(row_dl)
         
+        archive_modes = [("off", "Off"), ("zip", "Zip"), ("tar.gz", "Tar (gzip)")]
+        row_archive = Adw.ComboRow(title="<b>Drag as archive</b>")
+        row_archive.set_subtitle("Drag the whole shelf as a single archive file")
+        row_archive.set_model(Gtk.StringList.new([label for _, label in archive_modes]))
+        current = self.settings.get("archive_drag", "off")
+        row_archive.set_selected(next((i for i, (mode, _) in enumerate(archive_modes) if mode == current), 0))
+        row_archive.connect("notify::selected",
+                            lambda r, p: self.update_setting("archive_drag", archive_modes[r.get_selected()][0]))
+        grp.add(row_archive)
+        
+        row_stored = Adw.SwitchRow(title="Store compressed files as-is")
+        row_stored.set_subtitle("Skip recompressing images, videos and archives in zip files")
+        row_stored.set_active(self.settings.get("archive_store_compressed", True))
+        row_stored.connect("notify::active", lambda r, p: self.update_setting("archive_store_compressed", r.get_active()))
+        grp.add(row_stored)
+        
         grp_app = Adw.PreferencesGroup(title="Application")
         page.add(grp_app)
         
@@ -776,26 +3203,45 @@ class DropShelfWindow(Adw.ApplicationWindow):
         
         prefs_window.present()
     def clear_cache(self, btn):
+        self.cancel_downloads()
+        self.archive_cancel.set()
+        self.archive_cancel = threading.Event()
+        self.csv_collector.discard()
+        if self.restore_id:
+            GLib.source_remove(self.restore_id)
+            self.finish_restore()
         self.store.remove_all()
+        self.index.clear()
+        self.watcher.clear()
+        if self.content_index:
+            self.content_index.clear()
+        self.texture_cache.clear()
         if os.path.exists(self.cache_dir):
             try:
+                import shutil
                 shutil.rmtree(self.cache_dir)
             except:
                 pass
         os.makedirs(self.cache_dir, exist_ok=True)
-        self.save_state()
+        self.thumbnails.disk_cache.reset()
+        self.blobs.reset()
+        self.storage.clear()
         btn.set_label("All Data Cleared!")
         GLib.timeout_add(2000, lambda: btn.set_label("Clear Cache") or False)
 
 
     def update_setting(self, key, val):
         self.settings[key] = val
-        self.save_state()
+        self.save_settings()
 
-
-    def update_setting(self, key, val):
-        self.settings[key] = val
-        self.save_state()
+    def set_csv_column(self, column, enabled):
+        columns = [c for c in self.settings.get("csv_columns", ["text"]) if c != column]
+        if enabled:
+            columns.append(column)
+        # Keep a stable column order regardless of toggle order
+        columns = ["text"] + [c for c in CSV_OPTIONAL_COLUMNS if c in columns]
+        self.update_setting("csv_columns", columns)
+        self.csv_collector.set_columns(columns)
 
     def show_shortcuts_window(self):
         ui_str = """
@@ -881,9 +3327,108 @@ class DropShelfWindow(Adw.ApplicationWindow):
         win.set_transient_for(self)
         win.present()
         
+def expand_stdin_args(argv):
+    # `dropshelf add -` reads one path per line from stdin here, in the invoking process,
+    # so the primary instance still receives every path in a single command-line call
+    args = [a for a in argv[1:] if not a.startswith("--")]
+    if not args or args[0] != "add" or "-" not in args:
+        return argv
+    paths = [line for line in sys.stdin.read().splitlines() if line]
+    expanded = []
+    for arg in argv:
+        if arg == "-":
+            expanded.extend(paths)
+            paths = []
+        else:
+            expanded.append(arg)
+    return expanded
+
+
 class DropShelfApp(Adw.Application):
+    # Invocations are forwarded over D-Bus to the primary instance under com.dropshelf.app:
+    #   dropshelf [FILE...]           add files (also what file managers use via Open)
+    #   dropshelf add PATH... | -      add paths, or newline-separated paths from stdin
+    #   dropshelf list [--json]        print the shelf
+    #   dropshelf clear                remove every unpinned item
     def __init__(self):
-        super().__init__(application_id='com.dropshelf.app', flags=Gio.ApplicationFlags.FLAGS_NONE)
+        super().__init__(application_id='com.dropshelf.app',
+                         flags=Gio.ApplicationFlags.HANDLES_COMMAND_LINE | Gio.ApplicationFlags.HANDLES_OPEN)
+        self.startup_profile = None
+        self.add_main_option("startup-profile", 0, GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+                             "Print startup timings once the shelf is restored, then quit", None)
+        self.add_main_option("json", 0, GLib.OptionFlags.NONE, GLib.OptionArg.NONE,
+                             "Print the output of `list` as JSON", None)
+        # Read at import by trace_path(); registered so option parsing accepts it
+        self.add_main_option("trace", 0, GLib.OptionFlags.NONE, GLib.OptionArg.FILENAME,
+                             "Record hot-path timings as a Chrome trace in FILE", "FILE")
+
+    def do_startup(self):
+        Adw.Application.do_startup(self)
+        if TRACER:
+            TRACER.start_heartbeat()
+
+    def do_handle_local_options(self, options):
+        if options.contains("startup-profile"):
+            self.startup_profile = StartupProfile()
+            # A profiling run must start its own instance rather than poke a running one
+            self.set_flags(self.get_flags() | Gio.ApplicationFlags.NON_UNIQUE)
+        return -1
+
+    def do_command_line(self, command_line):
+        args = command_line.get_arguments()[1:]
+        if not args:
+            self.activate()
+            return 0
+        win = self.get_shelf_window()
+        # The caller blocks until command_line is released, which happens once this has run
+        win.run_when_restored(lambda: self.run_command(win, command_line, args))
+        return 0
+
+    def do_open(self, files, n_files, hint):
+        win = self.get_shelf_window()
+        paths = [f.get_path() for f in files]
+        # Like a drop, an Open is ignored while the shelf is locked
+        win.run_when_restored(lambda: None if win.locked else win.add_paths(paths))
+
+    def get_shelf_window(self):
+        for win in self.get_windows():
+            if isinstance(win, DropShelfWindow):
+                return win
+        self.activate()
+        return self.props.active_window
+
+    def run_command(self, win, command_line, args):
+        command, rest = args[0], args[1:]
+        if command not in ("add", "list", "clear"):
+            command, rest = "add", args
+        status = 0
+        if command != "list" and win.locked:
+            command_line.printerr_literal(f"dropshelf: {command}: the shelf is locked (read-only)\n")
+            status = 1
+        elif command == "add":
+            missing = win.add_paths([command_line.create_file_for_arg(arg).get_path() or arg for arg in rest])
+            if missing:
+                command_line.printerr_literal("".join(f"dropshelf: {p}: No such file\n" for p in missing))
+                status = 1
+        elif command == "list":
+            items = win.list_items()
+            if command_line.get_options_dict().contains("json"):
+                out = json.dumps([{"path": i.path, "filename": i.filename, "pinned": i.pinned} for i in items]) + "\n"
+            else:
+                out = "".join(f"{i.path}\n" for i in items)
+            command_line.print_literal(out)
+        else:
+            win.clear_unpinned()
+        command_line.set_exit_status(status)
+
+    def on_restored(self, win):
+        profile = self.startup_profile
+        if profile:
+            self.startup_profile = None
+            profile.mark("restored")
+            profile.items = win.store.get_n_items()
+            profile.report()
+            self.quit()
     
     def do_activate(self):
         # --- CUSTOM CSS ---
@@ -901,11 +3446,20 @@ class DropShelfApp(Adw.Application):
         win = self.props.active_window
         if not win:
             win = DropShelfWindow(self)
+            win.mark_startup("window")
             win.present()
         else:
             win.set_visible(True)
             win.present()
 
+    def do_shutdown(self):
+        for win in self.get_windows():
+            if isinstance(win, DropShelfWindow):
+                win.shutdown()
+        if TRACER:
+            TRACER.write()
+        Adw.Application.do_shutdown(self)
+
 if __name__ == '__main__':
     app = DropShelfApp()
-    app.run(sys.argv)
+    app.run(expand_stdin_args(sys.argv))